@@ -1,14 +1,12 @@
+# Run from the repository root so the shared weather_tool.py is importable:
+#     python -m advanced_agent.advanced
 from dataclasses import dataclass
 from pyexpat.errors import messages
-import requests
 from langchain_ollama import ChatOllama
 from langchain.agents import create_agent
-from langchain.tools import tool
 
-@tool("get_weather", description="Get the current weather for a given location.",   return_direct=False)
-def get_weather(city: str):
-    response = requests.get(f"https://wttr.in/{city}?format=j1")
-    return response.json()
+# weather_tool.py lives in the repository root (see the note at the top)
+from weather_tool import get_weather  # cached, pooled, trimmed wttr.in lookup
 
 agent = create_agent(
     model=ChatOllama(model="llama3.1:8b"),
@@ -1,17 +1,44 @@
-import requests
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared, pooled HTTP session used by every probe (one keep-alive pool per host)
+PROBE_WORKERS = 8
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+
+# Probe result when the provider gave no definitive answer (timeout, DNS or
+# connection error, rate limit, server error); never cached
+INCONCLUSIVE = (None, None, [])
+
+
+def no_match(response):
+    """Probe result for a response that didn't match the provider"""
+    if response.status_code == 429 or response.status_code >= 500:
+        return INCONCLUSIVE
+    return False, None, []
 
 def test_openai(api_key):
     """Test if API key is from OpenAI"""
     try:
         headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.get("https://api.openai.com/v1/models", headers=headers, timeout=5)
+        response = session.get("https://api.openai.com/v1/models", headers=headers, timeout=5)
         if response.status_code == 200:
             models = [model['id'] for model in response.json().get('data', [])]
             return True, "OpenAI", models
-        return False, None, []
+        return no_match(response)
     except:
-        return False, None, []
+        return INCONCLUSIVE
 
 def test_anthropic(api_key):
     """Test if API key is from Anthropic (Claude)"""
@@ -22,70 +49,70 @@ def test_anthropic(api_key):
             "content-type": "application/json"
         }
         data = {"model": "claude-3-haiku-20240307", "max_tokens": 1, "messages": [{"role": "user", "content": "Hi"}]}
-        response = requests.post("https://api.anthropic.com/v1/messages", headers=headers, json=data, timeout=5)
+        response = session.post("https://api.anthropic.com/v1/messages", headers=headers, json=data, timeout=5)
         if response.status_code in [200, 400]:
             # Anthropic doesn't have a models endpoint, return known models
             models = ["claude-3-5-sonnet-20241022", "claude-3-5-haiku-20241022", "claude-3-opus-20240229", 
                      "claude-3-sonnet-20240229", "claude-3-haiku-20240307"]
             return True, "Anthropic (Claude)", models
-        return False, None, []
+        return no_match(response)
     except:
-        return False, None, []
+        return INCONCLUSIVE
 
 def test_google_ai(api_key):
     """Test if API key is from Google AI (Gemini)"""
     try:
         url = f"https://generativelanguage.googleapis.com/v1/models?key={api_key}"
-        response = requests.get(url, timeout=5)
+        response = session.get(url, timeout=5)
         if response.status_code == 200:
             models = [model['name'].replace('models/', '') for model in response.json().get('models', [])]
             return True, "Google AI (Gemini)", models
-        return False, None, []
+        return no_match(response)
     except:
-        return False, None, []
+        return INCONCLUSIVE
 
 def test_huggingface(api_key):
     """Test if API key is from HuggingFace"""
     try:
         headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.get("https://huggingface.co/api/whoami", headers=headers, timeout=5)
+        response = session.get("https://huggingface.co/api/whoami", headers=headers, timeout=5)
         if response.status_code == 200:
             models = ["Access to all HuggingFace models via Inference API"]
             return True, "HuggingFace", models
-        return False, None, []
+        return no_match(response)
     except:
-        return False, None, []
+        return INCONCLUSIVE
 
 def test_cohere(api_key):
     """Test if API key is from Cohere"""
     try:
         headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.get("https://api.cohere.ai/v1/check-api-key", headers=headers, timeout=5)
+        response = session.get("https://api.cohere.ai/v1/check-api-key", headers=headers, timeout=5)
         if response.status_code == 200:
             models = ["command-r-plus", "command-r", "command", "command-light", "embed-english-v3.0", "embed-multilingual-v3.0"]
             return True, "Cohere", models
-        return False, None, []
+        return no_match(response)
     except:
-        return False, None, []
+        return INCONCLUSIVE
 
 def test_replicate(api_key):
     """Test if API key is from Replicate"""
     try:
         headers = {"Authorization": f"Token {api_key}"}
-        response = requests.get("https://api.replicate.com/v1/account", headers=headers, timeout=5)
+        response = session.get("https://api.replicate.com/v1/account", headers=headers, timeout=5)
         if response.status_code == 200:
             models = ["Access to all Replicate models (meta/llama-2, stability-ai/sdxl, etc.)"]
             return True, "Replicate", models
-        return False, None, []
+        return no_match(response)
     except:
-        return False, None, []
+        return INCONCLUSIVE
 
 def test_grok(api_key):
     """Test if API key is from Grok"""
     try:
         # Grok uses its own endpoint domain
         headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.get("https://api.grok.com/v1/models", headers=headers, timeout=5)
+        response = session.get("https://api.grok.com/v1/models", headers=headers, timeout=5)
         # treat 200, 401 or 403 as indications the endpoint exists (401/403 may mean invalid key)
         if response.status_code in [200, 401, 403]:
             models = []
@@ -101,64 +128,328 @@ def test_grok(api_key):
             return True, "Grok", models
         # print debug info on unexpected status codes for troubleshooting
         print(f"Grok probe returned {response.status_code}: {response.text}")
-        return False, None, []
+        return no_match(response)
     except Exception as e:
         print("Grok test exception:", e)
-        return False, None, []
+        return INCONCLUSIVE
 
 
 def test_stability_ai(api_key):
     """Test if API key is from Stability AI"""
     try:
         headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.get("https://api.stability.ai/v1/user/account", headers=headers, timeout=5)
+        response = session.get("https://api.stability.ai/v1/user/account", headers=headers, timeout=5)
         if response.status_code == 200:
             models = ["stable-diffusion-xl-1024-v1-0", "stable-diffusion-v1-6", "stable-diffusion-xl-beta-v2-2-2"]
             return True, "Stability AI", models
-        return False, None, []
+        return no_match(response)
     except:
-        return False, None, []
+        return INCONCLUSIVE
+
+PROBES = [
+    test_openai,
+    test_anthropic,
+    test_google_ai,
+    test_huggingface,
+    test_cohere,
+    test_replicate,
+    test_grok,
+    test_stability_ai
+]
+
+
+def service_name(test_func):
+    """Human readable provider name taken from the probe docstring"""
+    return test_func.__doc__.split("from ")[-1].strip("\"")
+
+
+# Known key formats: (pattern, probes to try in order, whether the format is conclusive).
+# More specific prefixes must come before the generic ones they overlap with.
+KEY_FORMATS = [
+    (re.compile(r"^sk-ant-"), [test_anthropic], True),
+    (re.compile(r"^sk-(proj|svcacct|admin)-"), [test_openai], True),
+    (re.compile(r"^sk-"), [test_openai, test_stability_ai], False),
+    (re.compile(r"^AIza[0-9A-Za-z_\-]{35}$"), [test_google_ai], True),
+    (re.compile(r"^hf_"), [test_huggingface], True),
+    (re.compile(r"^r8_"), [test_replicate], True),
+    (re.compile(r"^xai-"), [test_grok], True),
+    (re.compile(r"^[0-9A-Za-z]{40}$"), [test_cohere], False),
+]
+
+
+def classify_api_key(api_key):
+    """
+    Order PROBES by how likely they are to match the key's format.
+
+    Returns the probes to run. When the format is conclusive only the matching
+    probe is returned, otherwise the likely probes come first followed by the rest.
+    """
+    for pattern, likely, conclusive in KEY_FORMATS:
+        if pattern.match(api_key):
+            if conclusive:
+                return list(likely)
+            return likely + [probe for probe in PROBES if probe not in likely]
+    return list(PROBES)
+
+
+def key_fingerprint(api_key):
+    """SHA-256 of the key, used wherever the key must not be stored in full"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
 
-def identify_api_key(api_key):
+class VerdictCache:
+    """On-disk cache of probe verdicts keyed by key fingerprint, with a TTL"""
+
+    def __init__(self, path, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, api_key):
+        with self._lock:
+            entry = self._entries.get(key_fingerprint(api_key))
+        if not entry or time.time() - entry["checked_at"] > self.ttl:
+            return None
+        return entry["provider"], entry["models"]
+
+    def put(self, api_key, provider, models):
+        with self._lock:
+            self._entries[key_fingerprint(api_key)] = {
+                "provider": provider,
+                "models": models,
+                "checked_at": time.time(),
+            }
+
+    def save(self):
+        now = time.time()
+        with self._lock:
+            entries = {k: v for k, v in self._entries.items() if now - v["checked_at"] <= self.ttl}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+
+class RateLimiter:
+    """Per-provider rate limiter shared by all probe threads"""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, provider):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(provider, now))
+            self._next_slot[provider] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def probe_api_key(api_key, executor, limiter=None, on_result=None, probes=None):
+    """
+    Run the probes concurrently and return the highest-priority match.
+
+    Probes are ranked by their position in probes (PROBES by default). As soon
+    as a probe matches, every lower-priority probe that has not started yet is
+    cancelled; the higher-priority ones are still awaited so the verdict does
+    not depend on which provider happened to answer first.
+
+    Returns (provider, models, conclusive). conclusive is False when nothing
+    matched and at least one probe got no definitive answer.
+    """
+    def run(test_func):
+        if limiter:
+            limiter.wait(service_name(test_func))
+        return test_func(api_key)
+
+    probes = probes or PROBES
+    futures = {executor.submit(run, test_func): rank for rank, test_func in enumerate(probes)}
+    best_rank, best = len(probes), (None, [])
+    inconclusive = False
+    pending = set(futures)
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            rank = futures[future]
+            if future.cancelled():
+                continue
+            try:
+                is_valid, provider, models = future.result()
+            except Exception:
+                is_valid, provider, models = INCONCLUSIVE
+            inconclusive = inconclusive or is_valid is None
+            if on_result:
+                on_result(probes[rank], is_valid)
+            if is_valid and rank < best_rank:
+                best_rank, best = rank, (provider, models)
+                for other in list(pending):
+                    if futures[other] > rank and other.cancel():
+                        pending.discard(other)
+        # Everything still pending ranks below the match, so it cannot win
+        if best_rank < len(probes) and all(futures[f] > best_rank for f in pending):
+            for other in pending:
+                other.cancel()
+            break
+
+    provider, models = best
+    return provider, models, provider is not None or not inconclusive
+
+
+def check_api_key(api_key, executor, limiter=None, on_result=None, cache=None):
+    """
+    Return (provider, models, conclusive) from the cache, or classify and probe the key.
+
+    Inconclusive results (network errors, timeouts) are not cached, so the key
+    is probed again next time.
+    """
+    if cache:
+        cached = cache.get(api_key)
+        if cached:
+            return (*cached, True)
+
+    provider, models, conclusive = probe_api_key(
+        api_key, executor, limiter, on_result, probes=classify_api_key(api_key)
+    )
+    if cache and conclusive:
+        cache.put(api_key, provider, models)
+    return provider, models, conclusive
+
+
+def identify_api_key(api_key, cache=None):
     """Test API key against multiple services"""
     print(f"Testing API key: {api_key[:8]}...{api_key[-4:]}")
     print("-" * 50)
-    
-    tests = [
-        test_openai,
-        test_anthropic,
-        test_google_ai,
-        test_huggingface,
-        test_cohere,
-        test_replicate,
-        test_grok,
-        test_stability_ai
-    ]
-    
-    for test_func in tests:
-        service_name = test_func.__doc__.split("from ")[-1].strip("\"")
-        print(f"Testing {service_name}...", end=" ")
-        is_valid, provider, models = test_func(api_key)
-        if is_valid:
-            print(f"✓ MATCH!")
-            return provider, models
-        print("✗")
-    
-    print("\nNo matching service found.")
-    return None, []
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        api_key = sys.argv[1]
-    else:
-        api_key = input("Enter your API key: ").strip()
-    
+    if cache and cache.get(api_key):
+        print("Using cached verdict")
+
+    def report(test_func, is_valid):
+        outcome = "no answer" if is_valid is None else "✓ MATCH!" if is_valid else "✗"
+        print(f"Testing {service_name(test_func)}... {outcome}")
+
+    executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS)
+    try:
+        provider, models, conclusive = check_api_key(api_key, executor, on_result=report, cache=cache)
+    finally:
+        # Don't block on probes that can no longer change the verdict
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if not provider:
+        print("\nNo matching service found." if conclusive else "\nSome services could not be reached.")
+    return provider, models, conclusive
+
+
+def read_keys(path):
+    """Yield (line number, key) pairs, skipping blank lines and # comments"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            key = line.strip()
+            if key and not key.startswith("#"):
+                yield line_no, key
+
+
+def bulk_audit(keys_path, output_path, workers=8, rate=5.0, cache=None):
+    """
+    Audit every key in keys_path and stream one result row per key to output_path.
+
+    The output format follows the file extension (.jsonl or .csv). Keys are
+    written masked together with their SHA-256 fingerprint, never in full.
+    """
+    fields = ["line", "key", "key_sha256", "status", "provider", "model_count", "models"]
+    limiter = RateLimiter(rate)
+    as_jsonl = output_path.lower().endswith(".jsonl")
+    total = matched = 0
+
+    with open(output_path, "w", newline="", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=workers * PROBE_WORKERS) as probe_executor, \
+            ThreadPoolExecutor(max_workers=workers) as key_executor:
+        writer = None if as_jsonl else csv.DictWriter(out, fieldnames=fields)
+        if writer:
+            writer.writeheader()
+
+        def audit(line_no, key):
+            provider, models, conclusive = check_api_key(key, probe_executor, limiter, cache=cache)
+            return {
+                "line": line_no,
+                "key": f"{key[:8]}...{key[-4:]}",
+                "key_sha256": key_fingerprint(key),
+                "status": "matched" if provider else "no_match" if conclusive else "network_error",
+                "provider": provider,
+                "model_count": len(models),
+                "models": models,
+            }
+
+        def write(row):
+            if writer:
+                writer.writerow({**row, "models": ";".join(row["models"])})
+            else:
+                out.write(json.dumps(row) + "\n")
+            out.flush()
+
+        # Keep a bounded window of keys in flight so huge dumps stay cheap on memory
+        in_flight = set()
+        for line_no, key in read_keys(keys_path):
+            in_flight.add(key_executor.submit(audit, line_no, key))
+            if len(in_flight) >= workers * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    row = future.result()
+                    write(row)
+                    total += 1
+                    matched += bool(row["provider"])
+        for future in in_flight:
+            row = future.result()
+            write(row)
+            total += 1
+            matched += bool(row["provider"])
+
+    print(f"Audited {total} keys, {matched} matched a provider. Results written to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Identify which AI provider an API key belongs to")
+    parser.add_argument("api_key", nargs="?", help="API key to test")
+    parser.add_argument("--bulk", metavar="FILE", help="audit every key in FILE (one per line)")
+    parser.add_argument("--output", default="audit.jsonl", help="bulk results file (.jsonl or .csv)")
+    parser.add_argument("--workers", type=int, default=8, help="keys audited concurrently in bulk mode")
+    parser.add_argument("--rate", type=float, default=5.0, help="max requests per second per provider in bulk mode")
+    parser.add_argument("--cache", default=".api_key_cache.json", help="verdict cache file")
+    parser.add_argument("--cache-ttl", type=float, default=86400, help="seconds a cached verdict stays valid")
+    parser.add_argument("--no-cache", action="store_true", help="always probe, ignoring the verdict cache")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else VerdictCache(args.cache, ttl=args.cache_ttl)
+
+    if args.bulk:
+        try:
+            bulk_audit(args.bulk, args.output, workers=args.workers, rate=args.rate, cache=cache)
+        finally:
+            if cache:
+                cache.save()
+        return
+
+    api_key = args.api_key or input("Enter your API key: ").strip()
+
     if not api_key:
         print("Error: No API key provided")
         sys.exit(1)
-    
-    result, models = identify_api_key(api_key)
-    
+
+    result, models, conclusive = identify_api_key(api_key, cache=cache)
+    if cache:
+        cache.save()
+
     if result:
         print(f"\n🎉 Your API key is from: {result}")
         print(f"\n📋 Available models ({len(models)}):")
@@ -166,6 +457,13 @@ if __name__ == "__main__":
             print(f"  {i}. {model}")
         if len(models) > 20:
             print(f"  ... and {len(models) - 20} more models")
+    elif not conclusive:
+        print("\n⚠️ Could not identify the API key provider: some probes failed (timeout or network error).")
+        print("Check your connection and try again.")
     else:
         print("\n❌ Could not identify the API key provider.")
         print("It might be from a service not tested, or the key might be invalid.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# pylint: disable=missing-function-docstring
+
+"""
+Benchmark HTML content extraction over a corpus of saved pages.
+
+Compares the previous multi-find_all extractor with extract_text_from_html
+(html.parser and, if installed, lxml) on time, peak memory and output size.
+
+usage:
+    python bench_extract.py path/to/pages/          # every *.html / *.htm file
+    python bench_extract.py page1.html page2.html --repeat 5
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from llm import extract_text_from_html
+
+
+def legacy_extract(html):
+    """The extractor fetch_content_from_url used before the single-pass rewrite"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    for element in soup(["script", "style", "nav", "footer", "header", "aside", "iframe"]):
+        element.decompose()
+
+    content_areas = soup.find_all(
+        ['article', 'main', 'div'],
+        class_=lambda x: x and any(keyword in x.lower() for keyword in ['content', 'article', 'post', 'entry', 'body'])
+    )
+
+    if not content_areas:
+        content_areas = [soup.body] if soup.body else [soup]
+
+    text_content = []
+
+    for area in content_areas:
+        for heading in area.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+            heading_text = heading.get_text(strip=True)
+            if heading_text:
+                text_content.append(f"\n## {heading_text}\n")
+
+        for para in area.find_all('p'):
+            para_text = para.get_text(strip=True)
+            if para_text and len(para_text) > 10:
+                text_content.append(para_text)
+
+        for code in area.find_all(['pre', 'code']):
+            code_text = code.get_text(strip=True)
+            if code_text:
+                text_content.append(f"\n```\n{code_text}\n```\n")
+
+        for ul in area.find_all(['ul', 'ol']):
+            for li in ul.find_all('li', recursive=False):
+                li_text = li.get_text(strip=True)
+                if li_text:
+                    text_content.append(f"• {li_text}")
+
+    full_content = "\n".join(text_content)
+    full_content = re.sub(r'\n{3,}', '\n\n', full_content)
+    return full_content.strip()
+
+
+def load_corpus(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "*.htm*")))
+        else:
+            files.append(path)
+    corpus = []
+    for file in files:
+        with open(file, "rb") as f:
+            corpus.append((os.path.basename(file), f.read()))
+    return corpus
+
+
+def measure(extract, corpus, repeat):
+    # Time without tracemalloc (it slows allocation-heavy code down a lot)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [extract(html) for _, html in corpus]
+        best = min(best, time.perf_counter() - start)
+
+    peak = 0
+    for _, html in corpus:
+        tracemalloc.start()
+        extract(html)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return best, peak, sum(len(output) for output in outputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML content extraction")
+    parser.add_argument("paths", nargs="+", help="HTML files or directories of saved pages")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs (best is reported)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths)
+    if not corpus:
+        parser.error("no HTML files found")
+    total_bytes = sum(len(html) for _, html in corpus)
+    print(f"Corpus: {len(corpus)} pages, {total_bytes / 1024:.0f} KiB\n")
+
+    extractors = [
+        ("legacy (html.parser)", legacy_extract),
+        ("single-pass (html.parser)", lambda html: extract_text_from_html(html, "html.parser")),
+    ]
+    try:
+        import lxml  # noqa: F401
+        extractors.append(("single-pass (lxml)", lambda html: extract_text_from_html(html, "lxml")))
+    except ImportError:
+        print("lxml not installed, skipping the lxml run\n")
+
+    print(f"{'extractor':<28}{'time (s)':>10}{'pages/s':>10}{'peak MiB':>10}{'output chars':>14}")
+    for name, extract in extractors:
+        elapsed, peak, output_chars = measure(extract, corpus, args.repeat)
+        print(f"{name:<28}{elapsed:>10.3f}{len(corpus) / elapsed:>10.1f}"
+              f"{peak / 1024 / 1024:>10.1f}{output_chars:>14,}")
+
+
+if __name__ == "__main__":
+    main()
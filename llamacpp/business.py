@@ -1,9 +1,58 @@
-from llm import get_llm
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
+import os
+import time
+import uuid
+
+from llm import get_llm, get_prompt_budget, lookup_cached_reply, session_kwargs, store_cached_reply
+from chat_memory import SummarizingBufferMemory
 from langchain.prompts import PromptTemplate
 
 
+def stream_reply(llm, prompt_text, counter, call_kwargs=None):
+    """
+    Print the reply as it streams in; return (reply, stats)
+    
+    Output tokens come from the provider's usage data when it sends any,
+    otherwise they're counted with the prompt budget's tokenizer. With
+    LLM_CACHE=true a cached reply is printed without calling the model, and
+    streamed replies are added to the cache.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    parts, usage_tokens = [], None
+    
+    print("AI: ", end="", flush=True)
+    cached = lookup_cached_reply(llm, prompt_text, call_kwargs)
+    if cached is not None:
+        first_token_at = time.perf_counter()
+        parts.append(cached)
+        print(cached, end="", flush=True)
+    else:
+        for chunk in llm.stream(prompt_text, **(call_kwargs or {})):
+            if isinstance(chunk.content, str) and chunk.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(chunk.content)
+                print(chunk.content, end="", flush=True)
+            if getattr(chunk, "usage_metadata", None):
+                usage_tokens = chunk.usage_metadata.get("output_tokens")
+    print()
+    
+    finished = time.perf_counter()
+    reply = "".join(parts)
+    if cached is None:
+        store_cached_reply(llm, prompt_text, reply, call_kwargs)
+    first_token_at = first_token_at or finished
+    tokens = usage_tokens or counter.count(reply)
+    generation_time = finished - first_token_at
+    return reply, {
+        "ttft": first_token_at - started,
+        "tokens": tokens,
+        "tokens_estimated": usage_tokens is None,
+        "tokens_per_second": tokens / generation_time if generation_time > 0 else 0.0,
+        "total": finished - started,
+    }
+
+
 def main():
     print("=" * 50)
     print("Welcome to the CLI chatbot!")
@@ -20,7 +69,10 @@ def main():
     print("\n Type \"quit to exit the chatbot.\n")
 
     llm = get_llm()
-    memory = ConversationBufferMemory()
+    # On llama.cpp the chat and its summaries each keep a server slot, so every
+    # turn only prefills the new part of the prompt
+    session_id = uuid.uuid4().hex
+    call_kwargs = session_kwargs(llm, session_id)
 
     if one_line_mode:
         template = """The following is a conversation between a human and an AI assistant. The assistant provides concise, one-line answers to the human's questions.
@@ -41,11 +93,24 @@ AI:"""
         input_variables=["history", "input"],
         template=template,
     )
-    conversation = ConversationChain(
+
+    # Constant-size history: the last few turns verbatim, older ones summarized
+    # in the background. Room is left for the summary and the next question.
+    budget = get_prompt_budget()
+    summary_tokens = int(os.getenv("MEMORY_SUMMARY_TOKENS", "256"))
+    memory = SummarizingBufferMemory(
         llm=llm,
-        memory=memory,
-        prompt=prompt,
+        llm_kwargs=session_kwargs(llm, f"{session_id}:summary"),
+        counter=budget.counter,
+        max_turns=int(os.getenv("MEMORY_MAX_TURNS", "6")),
+        max_tokens=min(
+            int(os.getenv("MEMORY_MAX_TOKENS", "1000")),
+            budget.available_input(template) - summary_tokens - 256,
+        ),
+        summary_tokens=summary_tokens,
     )
+    # CHAT_STATS=true prints time-to-first-token and throughput after every reply
+    show_stats = os.getenv("CHAT_STATS", "false").lower() == "true"
 
 
     while True:
@@ -57,8 +122,15 @@ AI:"""
             continue
 
         try:
-            response = conversation.predict(input=user_input)
-            print(f"AI: {response}")
+            history = memory.load_memory_variables({"input": user_input})["history"]
+            response, stats = stream_reply(
+                llm, prompt.format(history=history, input=user_input), budget.counter, call_kwargs
+            )
+            memory.save_context({"input": user_input}, {"response": response})
+            if show_stats:
+                print(f"⏱️ first token {stats['ttft']:.2f}s | "
+                      f"{stats['tokens']}{'~' if stats['tokens_estimated'] else ''} tokens "
+                      f"at {stats['tokens_per_second']:.1f} tok/s | total {stats['total']:.2f}s")
         except Exception as e:
             print(f"An error occurred: {e}")
 
@@ -0,0 +1,141 @@
+# pylint: disable=missing-function-docstring
+
+"""
+Conversation memory with a constant-size history for the CLI chatbot.
+
+The last few turns are kept verbatim within a token budget; older turns are
+folded into a running summary by a background thread after the reply has
+been printed, so the next prompt doesn't wait for it. Turns that are still
+being summarized stay in the history, verbatim, until the summary covering
+them is in place (or, if summarizing fails, until a later attempt succeeds);
+when they don't all fit the token budget, the oldest are left out of the
+prompt first but stay queued for summarizing.
+"""
+
+import threading
+from typing import Any
+
+from langchain_core.memory import BaseMemory
+from pydantic import ConfigDict, PrivateAttr
+
+from token_budget import TokenCounter, pack_text
+
+SUMMARY_PROMPT = """Progressively summarize the conversation, adding onto the previous summary.
+Keep names, numbers, decisions and open questions. Reply with the new summary only.
+
+Previous summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+
+
+class SummarizingBufferMemory(BaseMemory):
+    """Last max_turns turns (at most max_tokens) verbatim, plus a summary of the rest"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    llm: Any
+    llm_kwargs: dict = {}  # extra kwargs for the summarization call (e.g. a session_id)
+    counter: Any = None
+    max_turns: int = 6
+    max_tokens: int = 1000
+    summary_tokens: int = 256
+    human_prefix: str = "human"
+    ai_prefix: str = "AI"
+    memory_key: str = "history"
+
+    _turns: list = PrivateAttr(default_factory=list)    # (text, tokens), oldest first
+    _pending: list = PrivateAttr(default_factory=list)  # turns not yet in the summary, oldest first
+    _summary: str = PrivateAttr(default="")
+    _worker: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context):
+        if self.counter is None:
+            self.counter = TokenCounter()
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs):
+        with self._lock:
+            # Show the newest pending turns that fit next to the kept ones
+            budget = self.max_tokens - sum(tokens for _, tokens in self._turns)
+            shown = []
+            for text, tokens in reversed(self._pending):
+                if tokens > budget:
+                    break
+                shown.insert(0, text)
+                budget -= tokens
+            lines = shown + [text for text, _ in self._turns]
+            if self._summary:
+                lines.insert(0, f"Summary of the earlier conversation: {self._summary}")
+        return {self.memory_key: "\n".join(lines)}
+
+    def save_context(self, inputs, outputs):
+        question = inputs.get("input") or next(v for k, v in inputs.items() if k != self.memory_key)
+        answer = outputs.get("response") or next(iter(outputs.values()))
+        text = f"{self.human_prefix}: {question}\n{self.ai_prefix}: {answer}"
+        with self._lock:
+            self._turns.append((text, self.counter.count(text)))
+            # Always keep the latest turn, even if it's over the budget on its own
+            while len(self._turns) > 1 and (
+                len(self._turns) > self.max_turns
+                or sum(tokens for _, tokens in self._turns) > self.max_tokens
+            ):
+                self._pending.append(self._turns.pop(0))
+            if self._pending and self._worker is None:
+                self._worker = threading.Thread(target=self._summarize_pending, daemon=True)
+                self._worker.start()
+
+    def _summarize_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                # The batch stays in _pending (and in the history) until its summary
+                # lands; at most max_tokens of the oldest turns go in one call
+                batch, budget = [], self.max_tokens
+                for turn in self._pending:
+                    if batch and turn[1] > budget:
+                        break
+                    batch.append(turn)
+                    budget -= turn[1]
+                summary = self._summary
+
+            prompt = SUMMARY_PROMPT.format(
+                summary=summary or "(none)",
+                lines="\n".join(text for text, _ in batch),
+            )
+            try:
+                result = self.llm.invoke(prompt, **self.llm_kwargs)
+            except Exception as e:
+                print(f"⚠️ Could not summarize older turns: {e}")
+                with self._lock:
+                    # The turns are still pending; retry with the next turn
+                    self._worker = None
+                return
+
+            new_summary = getattr(result, "content", result).strip()
+            new_summary, _ = pack_text(self.counter, new_summary, self.summary_tokens, suffix="")
+            with self._lock:
+                if self._pending[:len(batch)] == batch:  # not cleared meanwhile
+                    self._summary = new_summary
+                    del self._pending[:len(batch)]
+
+    def wait_for_summary(self, timeout=None):
+        """Block until background summarization is done (e.g. before exiting)"""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._pending.clear()
+            self._summary = ""
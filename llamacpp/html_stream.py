@@ -0,0 +1,164 @@
+# pylint: disable=missing-function-docstring
+
+"""
+Incremental HTML text extraction for streamed page downloads.
+
+StreamingTextExtractor applies the same rules as llm.extract_text_from_html
+(headings, paragraphs > 10 chars, code blocks, direct list items; content
+areas preferred; script/style/nav/... skipped), but is fed chunk by chunk so
+the download can stop as soon as enough text has been collected. The tag
+sets and block formatting here are shared by both extractors.
+"""
+
+from html.parser import HTMLParser
+
+SKIPPED_TAGS = {"script", "style", "nav", "footer", "header", "aside", "iframe"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+AREA_TAGS = {"article", "main", "div"}
+AREA_KEYWORDS = ("content", "article", "post", "entry", "body")
+
+BLOCK_TAGS = HEADING_TAGS | {"p", "pre", "code", "ul", "ol"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input",
+             "link", "meta", "source", "track", "wbr"}
+# Tags that implicitly close an open <p>
+CLOSES_P = BLOCK_TAGS | AREA_TAGS | {"section", "table", "form", "blockquote", "li"}
+MIN_PARAGRAPH_CHARS = 10  # Filter out very short paragraphs
+
+
+def is_area_class(classes) -> bool:
+    return any(keyword in cls.lower() for cls in classes for keyword in AREA_KEYWORDS)
+
+
+def format_block(name, text) -> list:
+    """Output lines for a heading, paragraph or code block's stripped text"""
+    if not text:
+        return []
+    if name in HEADING_TAGS:
+        return [f"\n## {text}\n"]
+    if name == "p":
+        return [text] if len(text) > MIN_PARAGRAPH_CHARS else []
+    return [f"\n```\n{text}\n```\n"]
+
+
+def format_list(items) -> list:
+    return [f"• {text}" for text in items if text]
+
+
+class StreamingTextExtractor(HTMLParser):
+    """Feed HTML text in chunks; read the extracted blocks at any point"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.area_content = []  # blocks inside content areas
+        self.page_content = []  # every block, used when the page has no content area
+        self.area_chars = 0
+        self.page_chars = 0
+        self._stack = []        # open tag names
+        self._skip_depth = None  # stack depth of the skipped element we're inside
+        self._area_depth = None  # stack depth of the outermost content area we're inside
+        self._block = None       # (name, depth, text pieces)
+        self._item = None        # current <li> of a list block: (depth, text pieces)
+        self._items = []
+        self._text = []          # raw data since the last tag, joined before stripping
+
+    # Extracted text ---------------------------------------------------------
+
+    def blocks(self) -> list:
+        return self.area_content or self.page_content
+
+    def _emit(self, blocks):
+        size = sum(len(block) + 1 for block in blocks)
+        self.page_content.extend(blocks)
+        self.page_chars += size
+        if self._area_depth is not None:
+            self.area_content.extend(blocks)
+            self.area_chars += size
+
+    # Tree bookkeeping -------------------------------------------------------
+
+    def _close_block(self):
+        name, _, pieces = self._block
+        self._block = None
+        if name in ("ul", "ol"):
+            self._close_item()
+            items, self._items = self._items, []
+            self._emit(format_list(items))
+            return
+        self._emit(format_block(name, "".join(pieces)))
+
+    def _close_item(self):
+        if self._item is not None:
+            self._items.append("".join(self._item[1]))
+            self._item = None
+
+    def _pop_to(self, depth):
+        """Close every open element deeper than depth"""
+        del self._stack[depth:]
+        if self._item is not None and self._item[0] >= depth:
+            self._close_item()
+        if self._block is not None and self._block[1] >= depth:
+            self._close_block()
+        if self._skip_depth is not None and self._skip_depth >= depth:
+            self._skip_depth = None
+        if self._area_depth is not None and self._area_depth >= depth:
+            self._area_depth = None
+
+    # HTMLParser callbacks ---------------------------------------------------
+
+    def _flush_text(self):
+        """Store the text run since the last tag (one bs4 string) as one stripped piece"""
+        if not self._text:
+            return
+        text = "".join(self._text).strip()
+        self._text = []
+        if not text or self._skip_depth is not None or self._block is None:
+            return
+        if self._block[0] in ("ul", "ol"):
+            if self._item is not None:
+                self._item[1].append(text)
+        else:
+            self._block[2].append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in VOID_TAGS:
+            return
+        if self._block and self._block[0] == "p" and tag in CLOSES_P:
+            self._pop_to(self._block[1])
+        if tag == "li" and self._item is not None and self._stack and self._stack[-1] == "li":
+            self._pop_to(len(self._stack) - 1)  # an unclosed <li> ends at the next one
+
+        depth = len(self._stack)
+        self._stack.append(tag)
+        if self._skip_depth is not None:
+            return
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = depth
+            return
+
+        if self._block is None:
+            if tag in BLOCK_TAGS:
+                self._block = (tag, depth, [])
+            elif self._area_depth is None and tag in AREA_TAGS:
+                classes = (dict(attrs).get("class") or "").split()
+                if is_area_class(classes):
+                    self._area_depth = depth
+        elif self._block[0] in ("ul", "ol") and tag == "li" and depth == self._block[1] + 1:
+            self._item = (depth, [])
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        # Close back to the matching open tag; ignore stray end tags
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if self._stack[depth] == tag:
+                self._pop_to(depth)
+                return
+
+    def handle_data(self, data):
+        if self._skip_depth is None and self._block is not None:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        self._pop_to(0)
@@ -0,0 +1,275 @@
+# pylint: disable=missing-function-docstring
+
+"""
+Persistent retrieval index over fetched knowledge-base pages.
+
+Pages are split into sentence-aligned chunks and embedded; the vectors are
+appended to a float32 file that is memory-mapped for scoring, and a SQLite
+table maps each row to its URL, position and text. A query is scored with
+blocked matrix-vector products against the rows of the requested URLs (or
+every row), and the top-k chunks are returned.
+
+A re-indexed page overwrites its old rows in place when its new chunks fit;
+otherwise they're appended and the old rows orphaned. Once orphaned rows
+exceed compact_ratio of the file, it is rewritten without them.
+
+The default HashingEmbedder needs nothing but NumPy: it hashes words and
+word pairs into a fixed-size, L2-normalized vector, which is enough to rank
+chunks of a page against the quiz instructions. Any object with
+embed_documents(texts) / embed_query(text) (e.g. LangChain's
+OllamaEmbeddings) can be passed instead.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from token_budget import split_sentences
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word bigrams"""
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        words = _WORD.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        digests = [hashlib.blake2b(f.encode(), digest_size=8).digest() for f in features]
+        hashes = np.frombuffer(b"".join(digests), dtype=np.uint64)
+        index = (hashes % np.uint64(self.dim)).astype(np.int64)
+        sign = np.where(hashes >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        return index, sign
+
+    def embed_documents(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            index, sign = self._features(text)
+            np.add.at(vectors[row], index, sign)
+        # Sublinear term frequency, then unit length so a dot product is cosine similarity
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def chunk_text(text, counter, chunk_tokens=200):
+    """Group sentences into chunks of about chunk_tokens tokens"""
+    chunks, current, used = [], [], 0
+    for sentence in split_sentences(text):
+        tokens = counter.count(sentence)
+        if current and used + tokens > chunk_tokens:
+            chunks.append("".join(current).strip())
+            current, used = [], 0
+        current.append(sentence)
+        used += tokens
+    if current:
+        chunks.append("".join(current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+class KnowledgeIndex:
+    """Memory-mapped chunk vectors plus a SQLite metadata table"""
+
+    def __init__(self, index_dir=".kb_index", embedder=None, ttl=86400, block_rows=65536,
+                 compact_ratio=0.5, compact_min_rows=1024):
+        self.embedder = embedder or HashingEmbedder()
+        self.ttl = ttl
+        self.block_rows = block_rows
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        os.makedirs(index_dir, exist_ok=True)
+        self._vectors_path = os.path.join(index_dir, "vectors.f32")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(index_dir, "meta.db"), check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " url TEXT PRIMARY KEY, fetched_at REAL NOT NULL,"
+            " first_row INTEGER NOT NULL, n_rows INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY, url TEXT NOT NULL,"
+            " position INTEGER NOT NULL, text TEXT NOT NULL);"
+        )
+        self._matrix = None  # memmap of the vectors file, reopened after appends
+        self._check_embedder()
+
+    def _check_embedder(self):
+        """Start over if the vectors on disk came from a different embedder"""
+        row = self._db.execute("SELECT value FROM info WHERE key = 'embedder'").fetchone()
+        name = getattr(self.embedder, "name", type(self.embedder).__name__)
+        if row and row[0] == name:
+            return
+        if row:
+            print(f"🧹 Embedder changed ({row[0]} -> {name}), clearing the knowledge index")
+        self._db.execute("DELETE FROM sources")
+        self._db.execute("DELETE FROM chunks")
+        self._db.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('embedder', ?)", (name,))
+        self._db.execute("DELETE FROM info WHERE key = 'dim'")
+        self._db.commit()
+        open(self._vectors_path, "wb").close()
+
+    @property
+    def dim(self):
+        row = self._db.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _rows(self):
+        dim = self.dim
+        if not dim or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * dim)
+
+    def _open_matrix(self):
+        if self._matrix is None:
+            rows = self._rows()
+            if rows:
+                self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    # Indexing ---------------------------------------------------------------
+
+    def has_fresh(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT fetched_at FROM sources WHERE url = ?", (url,)).fetchone()
+        return bool(row) and time.time() - row[0] < self.ttl
+
+    def add(self, url, chunks):
+        """Embed and store a page's chunks, replacing any earlier version of the page"""
+        if not chunks:
+            return
+        vectors = np.ascontiguousarray(self.embedder.embed_documents(chunks), dtype=np.float32)
+        with self._lock:
+            dim = self.dim
+            if dim is None:
+                self._db.execute("INSERT INTO info (key, value) VALUES ('dim', ?)", (str(vectors.shape[1]),))
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"Embedding size {vectors.shape[1]} doesn't match the index ({dim})")
+
+            old = self._db.execute("SELECT first_row, n_rows FROM sources WHERE url = ?", (url,)).fetchone()
+            self._db.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            self._matrix = None
+            if old and len(chunks) <= old[1]:
+                # Reuse the page's row range; rows past the new chunks are orphaned
+                first_row = old[0]
+                with open(self._vectors_path, "r+b") as f:
+                    f.seek(first_row * vectors.shape[1] * 4)
+                    f.write(vectors.tobytes())
+            else:
+                # Old rows of this URL stay in the vectors file until the next compaction
+                first_row = self._rows()
+                with open(self._vectors_path, "ab") as f:
+                    f.write(vectors.tobytes())
+            self._db.executemany(
+                "INSERT INTO chunks (row, url, position, text) VALUES (?, ?, ?, ?)",
+                [(first_row + i, url, i, chunk) for i, chunk in enumerate(chunks)],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources (url, fetched_at, first_row, n_rows) VALUES (?, ?, ?, ?)",
+                (url, time.time(), first_row, len(chunks)),
+            )
+            self._db.commit()
+            self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        """Rewrite the vectors file without orphaned rows once they make up compact_ratio of it"""
+        total = self._rows()
+        live = self._db.execute("SELECT COALESCE(SUM(n_rows), 0) FROM sources").fetchone()[0]
+        orphaned = total - live
+        if orphaned < self.compact_min_rows or orphaned <= total * self.compact_ratio:
+            return
+
+        dim = self.dim
+        matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(total, dim))
+        sources = self._db.execute("SELECT url, first_row, n_rows FROM sources ORDER BY first_row").fetchall()
+        tmp_path = f"{self._vectors_path}.tmp"
+        new_first = 0
+        with open(tmp_path, "wb") as f:
+            for url, first_row, n_rows in sources:
+                f.write(np.ascontiguousarray(matrix[first_row:first_row + n_rows]).tobytes())
+                # Renumber through negative rows so the shift never collides with a live row
+                self._db.execute(
+                    "UPDATE chunks SET row = -1 - (row - ?) WHERE url = ?", (first_row - new_first, url)
+                )
+                self._db.execute("UPDATE sources SET first_row = ? WHERE url = ?", (new_first, url))
+                new_first += n_rows
+        del matrix
+        self._db.execute("UPDATE chunks SET row = -1 - row WHERE row < 0")
+        os.replace(tmp_path, self._vectors_path)
+        self._db.commit()
+        print(f"🧹 Compacted the knowledge index: {total} -> {live} rows")
+
+    # Search -----------------------------------------------------------------
+
+    def _score(self, matrix, query, start, stop):
+        """Scores of rows start..stop, computed block by block to bound memory"""
+        scores = np.empty(stop - start, dtype=np.float32)
+        for block in range(start, stop, self.block_rows):
+            end = min(block + self.block_rows, stop)
+            scores[block - start:end - start] = matrix[block:end] @ query
+        return scores
+
+    def search(self, query, urls=None, k=8):
+        """
+        Top-k chunks for the query, best first.
+
+        Restricted to the given URLs when urls is set. Returns a list of
+        dicts with 'url', 'position', 'text' and 'score'.
+        """
+        query_vector = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        with self._lock:
+            matrix = self._open_matrix()
+            if matrix is None:
+                return []
+            # Only the current rows of each source; replaced pages' rows are skipped
+            if urls is None:
+                sources = self._db.execute("SELECT first_row, n_rows FROM sources")
+            else:
+                placeholders = ",".join("?" * len(urls))
+                sources = self._db.execute(
+                    f"SELECT first_row, n_rows FROM sources WHERE url IN ({placeholders})", list(urls)
+                )
+            ranges = [(first, first + n) for first, n in sources]
+            if not ranges:
+                return []
+
+            rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+            scores = np.concatenate([self._score(matrix, query_vector, start, stop) for start, stop in ranges])
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for i in top:
+                meta = self._db.execute(
+                    "SELECT url, position, text FROM chunks WHERE row = ?", (int(rows[i]),)
+                ).fetchone()
+                results.append({"url": meta[0], "position": meta[1], "text": meta[2], "score": float(scores[i])})
+            return results
+
+    def page_chunks(self, url, limit=None):
+        """A page's chunks in document order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT position, text FROM chunks WHERE url = ? ORDER BY position LIMIT ?",
+                (url, -1 if limit is None else limit),
+            ).fetchall()
+        return [{"url": url, "position": position, "text": text, "score": 0.0} for position, text in rows]
+
+    def stats(self):
+        with self._lock:
+            sources = self._db.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+            chunks = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            return {"sources": sources, "chunks": chunks, "rows": self._rows(), "dim": self.dim}
@@ -10,11 +10,33 @@ source:
 import os
 import requests
 import re
+import threading
+import time
+import codecs
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, ClassVar
+from urllib.parse import urlsplit
+import openai
 from dotenv import load_dotenv
+from langchain_core.caches import BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
 from langchain_ollama import ChatOllama
 from langchain_openai import ChatOpenAI
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
+from llm_cache import TieredLLMCache
+from url_cache import UrlCache
+from token_budget import PromptBudget, TokenCounter
+try:
+    from kb_index import KnowledgeIndex, chunk_text
+except ImportError:  # NumPy isn't installed
+    KnowledgeIndex = None
+from html_stream import (AREA_TAGS, HEADING_TAGS, SKIPPED_TAGS, StreamingTextExtractor,
+                         format_block, format_list, is_area_class)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -29,18 +51,51 @@ class LLMAdapter(ABC):
         """Return configured LLM client"""
         pass
 
+    def client_config(self) -> dict:
+        """Resolved settings that identify the client (used as the registry key)"""
+        return {}
+
+    def check_ready(self):
+        """Raise ConnectionError if the provider can't serve requests right now"""
+        pass
+
+    def model_limits(self) -> dict:
+        """
+        Context window, output token limit and tokenizer model of the client
+        
+        Optional keys: tokenize_url (a llama.cpp /tokenize endpoint counting
+        with the served model's own tokenizer) and safety_margin (tokens kept
+        free for chat formatting and counting error, default 32).
+        """
+        return {"context_window": 4096, "max_output_tokens": 512, "tokenizer": None}
+
 
 # Concrete Adapters for different LLM providers
 class OllamaAdapter(LLMAdapter):
     """Adapter for Ollama LLM provider"""
     
+    def client_config(self):
+        return {"model": os.getenv("OLLAMA_MODEL", "llama3.2:3b")}
+
+    def model_limits(self):
+        # Ollama's default num_ctx; raise OLLAMA_NUM_CTX along with the server setting
+        context_window = int(os.getenv("OLLAMA_NUM_CTX", "2048"))
+        return {
+            "context_window": context_window,
+            "max_output_tokens": 512,
+            "tokenizer": None,
+            # Ollama has no tokenize endpoint and cl100k_base can undercount
+            # other vocabularies by 10-20%, so keep a tenth of the window free
+            "safety_margin": max(32, context_window // 10),
+        }
+
     def get_client(self):
-        model = os.getenv("OLLAMA_MODEL", "llama3.2:3b")
+        model = self.client_config()["model"]
         
         return ChatOllama(
             model=model,
             temperature=0.7,
-            num_predict=512,
+            num_predict=self.model_limits()["max_output_tokens"],
             timeout=120  # Increased timeout to 120 seconds
         )
 
@@ -48,56 +103,628 @@ class OllamaAdapter(LLMAdapter):
 class OpenAIAdapter(LLMAdapter):
     """Adapter for OpenAI LLM provider"""
     
+    def client_config(self):
+        return {
+            "api_key": os.getenv("OPENAI_API_KEY"),
+            "model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+        }
+
+    def model_limits(self):
+        return {
+            "context_window": int(os.getenv("OPENAI_CONTEXT_WINDOW", "128000")),
+            "max_output_tokens": 512,
+            "tokenizer": self.client_config()["model"],
+        }
+
     def get_client(self):
-        api_key = os.getenv("OPENAI_API_KEY")
+        config = self.client_config()
+        api_key = config["api_key"]
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
         
-        model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        model = config["model"]
         
         return ChatOpenAI(
             api_key=api_key,
             model=model,
             temperature=0.7,
-            max_tokens=512,
+            max_tokens=self.model_limits()["max_output_tokens"],
+            stream_usage=True,  # token counts in the last streamed chunk
             timeout=120  # Increased timeout to 120 seconds
         )
 
 
-class LlamaCppAdapter(LLMAdapter):
-    """Adapter for llama.cpp LLM provider"""
+def check_llama_cpp_health(base_url, timeout=5):
+    """Check if the llama.cpp server at base_url is running"""
+    try:
+        # Try to reach the health endpoint or models endpoint
+        health_url = base_url.replace('/v1', '/health')
+        response = requests.get(health_url, timeout=timeout)
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
+        try:
+            # Fallback: try the models endpoint
+            models_url = f"{base_url}/models"
+            response = requests.get(models_url, timeout=timeout)
+            return response.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+
+# Output limit of llama.cpp clients
+LLAMA_CPP_MAX_TOKENS = 600
+
+
+def make_llama_cpp_client(base_url):
+    """ChatOpenAI client pointed at one llama.cpp server"""
+    return ChatOpenAI(
+        base_url=base_url,
+        api_key="local-llama",  # Required by interface, ignored by llama.cpp
+        model="llama.cpp",      # Name is ignored by server
+        temperature=0.6,
+        max_tokens=LLAMA_CPP_MAX_TOKENS,
+        extra_body={"cache_prompt": True},  # reuse the slot's KV cache for a shared prefix
+        timeout=180  # Increased timeout to 180 seconds for local models
+    )
+
+
+def get_llama_cpp_slots(base_url, timeout=2):
+    """Number of parallel slots (--parallel) of a llama.cpp server; LLAMA_CPP_SLOTS overrides"""
+    if os.getenv("LLAMA_CPP_SLOTS"):
+        return int(os.getenv("LLAMA_CPP_SLOTS"))
+    try:
+        response = requests.get(base_url.replace('/v1', '/props'), timeout=timeout)
+        if response.status_code == 200:
+            return int(response.json().get("total_slots", 1))
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return 1
+
+
+class SlotAffinity:
+    """
+    Pins sessions to llama.cpp server slots so a conversation keeps hitting
+    the slot whose KV cache already holds its prefix.
+    
+    When every slot is taken, the least recently used session loses its slot.
+    """
+    
+    def __init__(self, n_slots):
+        self.n_slots = max(1, n_slots)
+        self.evictions = 0
+        self._sessions = OrderedDict()  # session_id -> slot, least recently used first
+        self._lock = threading.Lock()
+    
+    def slot_for(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+                return self._sessions[session_id]
+            
+            taken = set(self._sessions.values())
+            free = [slot for slot in range(self.n_slots) if slot not in taken]
+            if free:
+                slot = free[0]
+            else:
+                _, slot = self._sessions.popitem(last=False)
+                self.evictions += 1
+            self._sessions[session_id] = slot
+            return slot
+    
+    def release(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
     
-    def __init__(self, base_url="http://127.0.0.1:8080/v1"):
+    def assignments(self):
+        with self._lock:
+            return dict(self._sessions)
+
+
+def _slot_kwargs(slots, session_id, kwargs):
+    """Request kwargs with prompt caching on and, for a session, its pinned slot"""
+    extra_body = {"cache_prompt": True, **(kwargs.pop("extra_body", None) or {})}
+    if session_id is not None and slots is not None:
+        extra_body["id_slot"] = slots.slot_for(session_id)
+    return {**kwargs, "extra_body": extra_body}
+
+
+class SessionChatModel(BaseChatModel):
+    """
+    Base for chat models that accept a session_id call kwarg
+    
+    The session only decides where a request runs (slot, replica, backend),
+    not what it answers, so it's left out of the llm_string the response
+    cache is keyed on: the same prompt hits the cache across sessions.
+    """
+    
+    supports_sessions: ClassVar[bool] = True
+    
+    def _get_llm_string(self, stop=None, **kwargs):
+        kwargs.pop("session_id", None)
+        return super()._get_llm_string(stop=stop, **kwargs)
+
+
+class LlamaCppSlotChat(SessionChatModel):
+    """
+    One llama.cpp server with per-session slot pinning
+    
+    Pass session_id with a call (llm.invoke(messages, session_id=...)) to
+    keep that conversation on one slot; calls without it let the server pick.
+    """
+    
+    client: Any
+    slots: Any
+    
+    @property
+    def _llm_type(self):
+        return "llama.cpp"
+    
+    @property
+    def _identifying_params(self):
+        # The wrapped client's llm_string carries URL, model and sampling
+        # settings, so the response cache is keyed on them
+        return {"client": self.client._get_llm_string()}
+    
+    def _generate(self, messages, stop=None, run_manager=None, session_id=None, **kwargs):
+        kwargs = _slot_kwargs(self.slots, session_id, kwargs)
+        return self.client._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+    
+    def _stream(self, messages, stop=None, run_manager=None, session_id=None, **kwargs):
+        kwargs = _slot_kwargs(self.slots, session_id, kwargs)
+        yield from self.client._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+class LlamaCppReplica:
+    """One llama.cpp server: its client, in-flight count and circuit breaker state"""
+    
+    def __init__(self, base_url):
         self.base_url = base_url
+        self.client = make_llama_cpp_client(base_url)
+        self.slots = None  # SlotAffinity, set once the server has answered a health probe
+        self.outstanding = 0
+        self.healthy = False
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # circuit is open (replica skipped) until this time
+    
+    def available(self, now):
+        return self.healthy and now >= self.open_until
+
+
+class LlamaCppReplicaPool:
+    """
+    Spreads requests over several llama.cpp servers.
+    
+    Health is probed by a background thread, never on the request path.
+    Requests go to the available replica with the fewest outstanding requests,
+    except that a session sticks to the replica it used last (its prompt cache
+    is there) while that replica is available. After failure_threshold consecutive failures a replica's circuit opens and
+    it gets no traffic for cooldown seconds (and until a probe succeeds).
+    """
+    
+    def __init__(self, base_urls, health_interval=5.0, failure_threshold=3, cooldown=30.0, max_sessions=1024):
+        self.replicas = [LlamaCppReplica(url) for url in base_urls]
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> replica, least recently used first
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._next = 0
+        
+        self.check_health()
+        self._thread = threading.Thread(target=self._health_loop, name="llama-cpp-health", daemon=True)
+        self._thread.start()
+    
+    def check_health(self):
+        """Probe every replica once and update its state"""
+        for replica in self.replicas:
+            healthy = check_llama_cpp_health(replica.base_url, timeout=2)
+            if healthy and replica.slots is None:
+                replica.slots = SlotAffinity(get_llama_cpp_slots(replica.base_url))
+            with self._lock:
+                replica.healthy = healthy
+                if healthy and replica.consecutive_failures >= self.failure_threshold \
+                        and time.monotonic() >= replica.open_until:
+                    # Cooldown over and the server answers again: close the circuit
+                    replica.consecutive_failures = 0
+    
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+    
+    def has_available(self):
+        now = time.monotonic()
+        with self._lock:
+            return any(replica.available(now) for replica in self.replicas)
+    
+    def acquire(self, exclude=(), session_id=None):
+        """Pick the session's replica or the least-loaded available one, and count the request against it"""
+        now = time.monotonic()
+        with self._lock:
+            # Rotate the starting point so ties are broken round-robin
+            order = self.replicas[self._next:] + self.replicas[:self._next]
+            self._next = (self._next + 1) % len(self.replicas)
+            candidates = [r for r in order if r.available(now) and r not in exclude]
+            if not candidates:
+                raise ConnectionError("No healthy llama.cpp replica available")
+            
+            replica = self._sessions.get(session_id)
+            if replica not in candidates:
+                replica = min(candidates, key=lambda r: r.outstanding)
+            if session_id is not None:
+                self._sessions[session_id] = replica
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            replica.outstanding += 1
+            return replica
+    
+    def release(self, replica, success):
+        with self._lock:
+            replica.outstanding -= 1
+            if success:
+                replica.consecutive_failures = 0
+                return
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= self.failure_threshold:
+                replica.open_until = time.monotonic() + self.cooldown
+                print(f"⚠️ Circuit opened for llama.cpp replica {replica.base_url}")
+    
+    def stats(self):
+        """Snapshot of replica state, for inspection"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "base_url": r.base_url,
+                    "healthy": r.healthy,
+                    "circuit_open": now < r.open_until,
+                    "outstanding": r.outstanding,
+                    "consecutive_failures": r.consecutive_failures,
+                }
+                for r in self.replicas
+            ]
+    
+    def close(self):
+        self._stop.set()
+
+
+# Errors worth retrying on another replica (the request never reached a model)
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.APITimeoutError)
+# Errors that count toward a replica's circuit breaker: transport failures and
+# 5xx. Caller errors (e.g. a 400 for a prompt over the context) say nothing
+# about the replica's health.
+CIRCUIT_ERRORS = RETRYABLE_ERRORS + (openai.InternalServerError,)
+
+
+class LlamaCppPoolChat(SessionChatModel):
+    """
+    Chat model that routes each call to a replica from a LlamaCppReplicaPool
+    
+    A session_id passed with a call pins the conversation to one replica and
+    one of its slots, like LlamaCppSlotChat.
+    """
+    
+    pool: Any
+    
+    @property
+    def _llm_type(self):
+        return "llama.cpp-pool"
+    
+    @property
+    def _identifying_params(self):
+        # The replicas' own llm_strings carry URL, model and sampling settings,
+        # so changing LLAMA_CPP_URLS invalidates old cached replies
+        return {"replicas": [replica.client._get_llm_string() for replica in self.pool.replicas]}
+    
+    def _generate(self, messages, stop=None, run_manager=None, session_id=None, **kwargs):
+        tried = []
+        while True:
+            replica = self.pool.acquire(exclude=tried, session_id=session_id)
+            try:
+                result = replica.client._generate(
+                    messages, stop=stop, run_manager=run_manager,
+                    **_slot_kwargs(replica.slots, session_id, dict(kwargs)),
+                )
+            except RETRYABLE_ERRORS:
+                self.pool.release(replica, success=False)
+                tried.append(replica)
+                if not self.pool.has_available() or len(tried) == len(self.pool.replicas):
+                    raise
+                continue
+            except CIRCUIT_ERRORS:
+                self.pool.release(replica, success=False)
+                raise
+            except Exception:
+                self.pool.release(replica, success=True)  # the replica answered; the request was bad
+                raise
+            self.pool.release(replica, success=True)
+            return result
+    
+    def _stream(self, messages, stop=None, run_manager=None, session_id=None, **kwargs):
+        replica = self.pool.acquire(session_id=session_id)
+        failed = False
+        try:
+            kwargs = _slot_kwargs(replica.slots, session_id, kwargs)
+            yield from replica.client._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except CIRCUIT_ERRORS:
+            failed = True
+            raise
+        finally:
+            self.pool.release(replica, success=not failed)
+
+
+class LlamaCppAdapter(LLMAdapter):
+    """
+    Adapter for llama.cpp LLM provider
+    
+    Set LLAMA_CPP_URLS to a comma separated list of server URLs to spread
+    requests over several llama.cpp processes (see LlamaCppReplicaPool).
+    """
+    
+    # base_url -> (healthy, checked_at), shared by all adapter instances
+    _health_cache = {}
+    _health_lock = threading.Lock()
+    
+    def __init__(self, base_url="http://127.0.0.1:8080/v1", base_urls=None):
+        urls = base_urls or [u.strip() for u in os.getenv("LLAMA_CPP_URLS", "").split(",") if u.strip()]
+        self.base_urls = urls or [base_url]
+        self.base_url = self.base_urls[0]
+        self.health_ttl = float(os.getenv("LLAMA_CPP_HEALTH_TTL", "30"))
+    
+    def client_config(self):
+        return {"base_urls": tuple(self.base_urls)}
+    
+    def model_limits(self):
+        # Match the server's --ctx-size (per slot when it runs with --parallel)
+        return {
+            "context_window": int(os.getenv("LLAMA_CPP_CTX_SIZE", "4096")),
+            "max_output_tokens": LLAMA_CPP_MAX_TOKENS,
+            "tokenizer": None,
+            # Count with the served model's tokenizer (replicas serve the same model)
+            "tokenize_url": self.base_url.replace('/v1', '/tokenize'),
+        }
+    
+    def is_healthy(self):
+        """Server health, re-probed at most once per health_ttl seconds"""
+        with self._health_lock:
+            cached = self._health_cache.get(self.base_url)
+        if cached and time.monotonic() - cached[1] < self.health_ttl:
+            return cached[0]
+        
+        healthy = self._check_server_health()
+        with self._health_lock:
+            self._health_cache[self.base_url] = (healthy, time.monotonic())
+        return healthy
+    
+    def check_ready(self):
+        # A replica pool tracks its own health in the background
+        if len(self.base_urls) > 1:
+            return
+        if not self.is_healthy():
+            raise ConnectionError(f"llama.cpp server is not running at {self.base_url}. Please start your llama.cpp server first.")
     
     def _check_server_health(self):
         """Check if llama.cpp server is running"""
-        try:
-            # Try to reach the health endpoint or models endpoint
-            health_url = self.base_url.replace('/v1', '/health')
-            response = requests.get(health_url, timeout=5)
-            return response.status_code == 200
-        except requests.exceptions.RequestException:
-            try:
-                # Fallback: try the models endpoint
-                models_url = f"{self.base_url}/models"
-                response = requests.get(models_url, timeout=5)
-                return response.status_code == 200
-            except requests.exceptions.RequestException:
-                return False
+        return check_llama_cpp_health(self.base_url)
     
     def get_client(self):
-        if not self._check_server_health():
-            raise ConnectionError(f"llama.cpp server is not running at {self.base_url}. Please start your llama.cpp server first.")
+        if len(self.base_urls) == 1:
+            self.check_ready()
+            return LlamaCppSlotChat(
+                client=make_llama_cpp_client(self.base_url),
+                slots=SlotAffinity(get_llama_cpp_slots(self.base_url)),
+            )
         
-        return ChatOpenAI(
-            base_url=self.base_url,
-            api_key="local-llama",  # Required by interface, ignored by llama.cpp
-            model="llama.cpp",      # Name is ignored by server
-            temperature=0.6,
-            max_tokens=600,
-            timeout=180  # Increased timeout to 180 seconds for local models
+        pool = LlamaCppReplicaPool(
+            self.base_urls,
+            health_interval=float(os.getenv("LLAMA_CPP_HEALTH_INTERVAL", "5")),
+            failure_threshold=int(os.getenv("LLAMA_CPP_FAILURE_THRESHOLD", "3")),
+            cooldown=float(os.getenv("LLAMA_CPP_CIRCUIT_COOLDOWN", "30")),
         )
+        if not pool.has_available():
+            pool.close()
+            raise ConnectionError(f"No llama.cpp server is running at {', '.join(self.base_urls)}. Please start your llama.cpp servers first.")
+        return LlamaCppPoolChat(pool=pool)
+
+
+class ProviderStats:
+    """EWMA latency / error rate and in-flight count for one routed provider"""
+    
+    def __init__(self, max_in_flight, alpha=0.2):
+        self.max_in_flight = max_in_flight
+        self.alpha = alpha
+        self.latency = None  # seconds, None until the first success
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.last_failure = 0.0
+    
+    def record(self, latency, success):
+        self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha * (0.0 if success else 1.0)
+        if success:
+            self.latency = latency if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * latency
+        else:
+            self.last_failure = time.monotonic()
+    
+    def eligible(self, max_error_rate, recovery):
+        """Has spare capacity and is healthy (or failed long enough ago to retry)"""
+        if self.in_flight >= self.max_in_flight:
+            return False
+        return self.error_rate <= max_error_rate or time.monotonic() - self.last_failure > recovery
+    
+    def score(self):
+        """Expected wait: latency scaled by current load and inflated by errors"""
+        if self.latency is None:
+            # Unmeasured providers are tried first, unless they have only failed so far
+            return 0.0 if self.error_rate == 0 else float("inf")
+        return self.latency * (1 + self.in_flight) / (1 - min(self.error_rate, 0.99))
+
+
+class LatencyRouterChat(SessionChatModel):
+    """
+    Chat model that sends each call to the currently fastest healthy provider.
+    
+    Providers whose EWMA error rate is above max_error_rate (until `recovery`
+    seconds after their last failure), or that already have max_in_flight
+    requests running, are skipped, so a saturated local
+    server spills over to the next-best provider instead of queueing. Failed
+    calls are retried on the next provider. Recent decisions are kept in
+    `decisions` and summarised by `routing_stats()`. A session_id passed with
+    a call is forwarded only to backends that support sessions.
+    """
+    
+    backends: dict
+    stats: dict
+    max_error_rate: float = 0.5
+    recovery: float = 30.0  # seconds before a failing provider is tried again
+    decisions: Any = None
+    lock: Any = None
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.decisions = deque(maxlen=200)
+        self.lock = threading.Lock()
+    
+    @property
+    def _llm_type(self):
+        return "latency-router"
+    
+    @property
+    def _identifying_params(self):
+        # Key the response cache on the backends, so changing
+        # LLM_ROUTER_PROVIDERS invalidates old cached replies
+        return {"backends": {name: self.backends[name]._get_llm_string() for name in sorted(self.backends)}}
+    
+    def _ranked(self, exclude=()):
+        with self.lock:
+            scores = {name: stats.score() for name, stats in self.stats.items()}
+            ranked = sorted(
+                (name for name, stats in self.stats.items()
+                 if name not in exclude and stats.eligible(self.max_error_rate, self.recovery)),
+                key=scores.get,
+            )
+            if not ranked and not exclude:
+                # Everyone is saturated or failing: fall back to the best score
+                ranked = sorted(self.stats, key=scores.get)
+        return ranked, scores
+    
+    def _acquire(self, exclude):
+        ranked, scores = self._ranked(exclude)
+        if not ranked:
+            return None
+        name = ranked[0]
+        with self.lock:
+            self.stats[name].in_flight += 1
+        self.decisions.append({"time": time.time(), "provider": name, "scores": scores})
+        return name
+    
+    def _release(self, name, started, success):
+        with self.lock:
+            stats = self.stats[name]
+            stats.in_flight -= 1
+            stats.record(time.perf_counter() - started, success)
+    
+    def _backend_kwargs(self, name, kwargs):
+        if getattr(self.backends[name], "supports_sessions", False):
+            return kwargs
+        return {key: value for key, value in kwargs.items() if key != "session_id"}
+    
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tried, last_error = [], None
+        while True:
+            name = self._acquire(tried)
+            if name is None:
+                raise last_error or ConnectionError("No provider available for the router")
+            started = time.perf_counter()
+            try:
+                result = self.backends[name]._generate(
+                    messages, stop=stop, run_manager=run_manager, **self._backend_kwargs(name, kwargs)
+                )
+            except Exception as e:
+                self._release(name, started, success=False)
+                print(f"⚠️ Router: {name} failed ({e}), trying next provider")
+                tried.append(name)
+                last_error = e
+                continue
+            self._release(name, started, success=True)
+            return result
+    
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        name = self._acquire(())
+        started = time.perf_counter()
+        success = False
+        try:
+            yield from self.backends[name]._stream(
+                messages, stop=stop, run_manager=run_manager, **self._backend_kwargs(name, kwargs)
+            )
+            success = True
+        finally:
+            self._release(name, started, success)
+    
+    def routing_stats(self):
+        """Current per-provider stats and the most recent routing decisions"""
+        with self.lock:
+            providers = {
+                name: {
+                    "ewma_latency": stats.latency,
+                    "error_rate": stats.error_rate,
+                    "in_flight": stats.in_flight,
+                    "max_in_flight": stats.max_in_flight,
+                }
+                for name, stats in self.stats.items()
+            }
+        return {"providers": providers, "recent_decisions": list(self.decisions)[-20:]}
+
+
+class RouterAdapter(LLMAdapter):
+    """
+    Adapter that routes across several providers by observed latency
+    
+    LLM_ROUTER_PROVIDERS: comma separated providers (default "llama.cpp,ollama,openai")
+    LLM_ROUTER_LIMITS: per-provider concurrency limits, e.g. "llama.cpp=2,ollama=2"
+    LLM_ROUTER_MAX_INFLIGHT: limit for providers not listed in LLM_ROUTER_LIMITS
+    """
+    
+    def client_config(self):
+        return {
+            "providers": os.getenv("LLM_ROUTER_PROVIDERS", "llama.cpp,ollama,openai"),
+            "limits": os.getenv("LLM_ROUTER_LIMITS", ""),
+            "max_in_flight": os.getenv("LLM_ROUTER_MAX_INFLIGHT", "4"),
+        }
+    
+    def model_limits(self):
+        # A request can land on any provider, so budget for the smallest one
+        limits = []
+        for provider in (p.strip().lower() for p in self.client_config()["providers"].split(",")):
+            if provider and provider != "router" and provider in LLMFactory._adapters:
+                limits.append(LLMFactory.create_adapter(provider).model_limits())
+        if not limits:
+            return super().model_limits()
+        return min(limits, key=lambda l: l["context_window"] - l["max_output_tokens"] - l.get("safety_margin", 32))
+    
+    def get_client(self):
+        config = self.client_config()
+        limits = dict(
+            (part.split("=")[0].strip(), int(part.split("=")[1]))
+            for part in config["limits"].split(",") if "=" in part
+        )
+        
+        backends, stats = {}, {}
+        for provider in (p.strip().lower() for p in config["providers"].split(",")):
+            if not provider or provider == "router":
+                continue
+            try:
+                backends[provider] = get_cached_client(provider, LLMFactory.create_adapter(provider))
+            except (ConnectionError, ValueError) as e:
+                print(f"Router: skipping {provider}: {e}")
+                continue
+            stats[provider] = ProviderStats(limits.get(provider, int(config["max_in_flight"])))
+        
+        if not backends:
+            raise ConnectionError("No provider available for the router")
+        print(f"Router providers: {', '.join(backends)}")
+        return LatencyRouterChat(backends=backends, stats=stats)
 
 
 # Factory Pattern - Creates appropriate LLM adapter based on provider
@@ -108,6 +735,7 @@ class LLMFactory:
         "ollama": OllamaAdapter,
         "openai": OpenAIAdapter,
         "llama.cpp": LlamaCppAdapter,
+        "router": RouterAdapter,
     }
     
     @classmethod
@@ -127,6 +755,90 @@ class LLMFactory:
         cls._adapters[provider] = adapter_class
 
 
+# Client registry - one warm client (and connection pool) per provider + resolved config
+_client_registry = {}
+_registry_lock = threading.Lock()
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """
+    Shared exact-match response cache, or None unless LLM_CACHE=true
+    
+    LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MEMORY_ENTRIES and
+    LLM_CACHE_MAX_BYTES tune it. Hit/miss counters are in .stats().
+    """
+    global _response_cache
+    if os.getenv("LLM_CACHE", "false").lower() != "true":
+        return None
+    with _registry_lock:
+        if _response_cache is None:
+            _response_cache = TieredLLMCache(
+                path=os.getenv("LLM_CACHE_PATH", ".llm_cache.db"),
+                ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+                max_memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512")),
+                max_disk_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+            )
+    return _response_cache
+
+
+def _cache_key(client, prompt_text: str, call_kwargs: dict):
+    """(cache, prompt, llm_string) the way client.invoke(prompt_text) keys its cache, or None"""
+    cache = getattr(client, "cache", None)
+    if not isinstance(cache, BaseCache):
+        return None
+    return cache, dumps([HumanMessage(content=prompt_text)]), client._get_llm_string(stop=None, **call_kwargs)
+
+
+def lookup_cached_reply(client, prompt_text: str, call_kwargs: dict = None):
+    """
+    Cached reply text for a prompt, or None
+    
+    client.stream() doesn't consult the response cache, so streaming callers
+    check it here first and store the streamed reply with store_cached_reply.
+    """
+    key = _cache_key(client, prompt_text, call_kwargs or {})
+    if key is None:
+        return None
+    cache, prompt, llm_string = key
+    generations = cache.lookup(prompt, llm_string)
+    return generations[0].text if generations else None
+
+
+def store_cached_reply(client, prompt_text: str, reply: str, call_kwargs: dict = None):
+    key = _cache_key(client, prompt_text, call_kwargs or {})
+    if key is not None and reply:
+        cache, prompt, llm_string = key
+        cache.update(prompt, llm_string, [ChatGeneration(message=AIMessage(content=reply))])
+
+
+def get_cached_client(provider: str, adapter: LLMAdapter):
+    """Return the registered client for this adapter's config, creating it once"""
+    adapter.check_ready()
+    key = (provider, tuple(sorted(adapter.client_config().items())))
+    
+    with _registry_lock:
+        client = _client_registry.get(key)
+    if client is None:
+        client = adapter.get_client()
+        cache = get_response_cache()
+        if cache is not None:
+            client.cache = cache
+        with _registry_lock:
+            client = _client_registry.setdefault(key, client)
+    return client
+
+
+def clear_llm_cache():
+    """Drop all registered clients and cached health results"""
+    with _registry_lock:
+        _client_registry.clear()
+    with LlamaCppAdapter._health_lock:
+        LlamaCppAdapter._health_cache.clear()
+
+
 def get_llm():
     """Get LLM client based on environment configuration"""
     provider = os.getenv("LLM_PROVIDER", "ollama")
@@ -135,22 +847,80 @@ def get_llm():
     try:
         adapter = LLMFactory.create_adapter(provider)
         print(f"Successfully created adapter for: {provider}")
-        return adapter.get_client()
+        return get_cached_client(provider.lower().strip(), adapter)
     except ConnectionError as e:
         print(f"Connection Error: {e}")
         print("Falling back to default Ollama provider")
-        return OllamaAdapter().get_client()
+        return get_cached_client("ollama", OllamaAdapter())
     except ValueError as e:
         print(f"Configuration Error: {e}")
         print("Falling back to default Ollama provider")
-        return OllamaAdapter().get_client()
+        return get_cached_client("ollama", OllamaAdapter())
     except Exception as e:
         print(f"Unexpected error: {e}")
         print("Falling back to default Ollama provider")
-        return OllamaAdapter().get_client()
+        return get_cached_client("ollama", OllamaAdapter())
+
+
+_token_counters = {}
+
+
+def get_prompt_budget(provider: str = None) -> PromptBudget:
+    """
+    Prompt budget for the configured provider's model limits
+    
+    Token counters are shared per tokenizer, so memoized counts survive
+    across calls.
+    """
+    provider = (provider or os.getenv("LLM_PROVIDER", "ollama")).lower().strip()
+    try:
+        limits = LLMFactory.create_adapter(provider).model_limits()
+    except ValueError:
+        limits = OllamaAdapter().model_limits()
+    
+    key = (limits["tokenizer"], limits.get("tokenize_url"))
+    with _registry_lock:
+        counter = _token_counters.get(key)
+        if counter is None:
+            counter = _token_counters[key] = TokenCounter(limits["tokenizer"], tokenize_url=key[1])
+    return PromptBudget(
+        limits["context_window"],
+        limits["max_output_tokens"],
+        counter=counter,
+        safety_margin=limits.get("safety_margin", 32),
+    )
+
+
+def session_kwargs(client, session_id) -> dict:
+    """Call kwargs that pin a conversation to a llama.cpp slot, or {} for clients without sessions"""
+    if getattr(client, "supports_sessions", False):
+        return {"session_id": session_id}
+    return {}
 
 
 # Tool Calling Functions
+def detect_urls_in_instructions(instructions: str) -> list:
+    """
+    Find every URL in the instructions
+    
+    Args:
+        instructions: User instructions text
+        
+    Returns:
+        List of unique URLs in the order they appear (empty if none)
+    """
+    if not instructions:
+        return []
+    
+    url_pattern = r'https?://[^\s]+'
+    urls = []
+    for match in re.findall(url_pattern, instructions):
+        url = match.rstrip('.,;:!?)]\'"')  # trailing sentence punctuation isn't part of the link
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
 def detect_url_in_instructions(instructions: str) -> str:
     """
     Detect if instructions contain a URL
@@ -159,85 +929,231 @@ def detect_url_in_instructions(instructions: str) -> str:
         instructions: User instructions text
         
     Returns:
-        URL string if found, None otherwise
+        First URL string if found, None otherwise
     """
-    if not instructions:
+    urls = detect_urls_in_instructions(instructions)
+    return urls[0] if urls else None
+
+
+# Shared session (keep-alive) and HTTP cache for knowledge-base pages.
+# Set URL_CACHE_ENABLED=false to always download, URL_CACHE_DIR to move the cache.
+# FETCH_WORKERS / FETCH_PER_HOST bound concurrent fetches overall and per host.
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "2"))
+_http_session = requests.Session()
+_http_session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+_http_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+_url_cache = UrlCache(os.getenv("URL_CACHE_DIR", ".url_cache")) \
+    if os.getenv("URL_CACHE_ENABLED", "true").lower() == "true" else None
+
+
+_kb_index = None
+
+
+def get_kb_index():
+    """
+    Shared retrieval index over fetched pages, or None if KB_INDEX=false or NumPy is missing
+    
+    KB_INDEX_DIR moves it, KB_INDEX_TTL (seconds, default 1 day) sets how long an
+    indexed page is used before it's fetched again, and KB_INDEX_COMPACT_RATIO
+    (default 0.5) is the share of orphaned rows that triggers a compaction.
+    """
+    global _kb_index
+    if KnowledgeIndex is None or os.getenv("KB_INDEX", "true").lower() != "true":
         return None
+    with _registry_lock:
+        if _kb_index is None:
+            _kb_index = KnowledgeIndex(
+                os.getenv("KB_INDEX_DIR", ".kb_index"),
+                ttl=float(os.getenv("KB_INDEX_TTL", "86400")),
+                compact_ratio=float(os.getenv("KB_INDEX_COMPACT_RATIO", "0.5")),
+            )
+    return _kb_index
+
+
+# Parser for extract_text_from_html: lxml when installed (much faster), else html.parser.
+# HTML_PARSER overrides the choice.
+try:
+    import lxml  # noqa: F401
+    DEFAULT_HTML_PARSER = os.getenv("HTML_PARSER", "lxml")
+except ImportError:
+    DEFAULT_HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
+
+# Content types fetch_content_from_url(stream=True) will download
+STREAMABLE_CONTENT_TYPES = {"text/html", "application/xhtml+xml", "text/plain"}
+
+
+def _is_content_area(tag) -> bool:
+    return tag.name in AREA_TAGS and is_area_class(tag.get("class") or [])
+
+
+def _block_text(tag):
+    """Formatted text for a block element, or None if the element isn't extracted"""
+    name = tag.name
+    if name in HEADING_TAGS or name in ("p", "pre", "code"):
+        return format_block(name, tag.get_text(strip=True))
+    if name in ("ul", "ol"):
+        return format_list(li.get_text(strip=True) for li in tag.find_all("li", recursive=False))
+    return None
+
+
+def extract_text_from_html(html, parser=None) -> str:
+    """
+    Extract headings, paragraphs, code blocks and list items from an HTML page
     
-    url_pattern = r'https?://[^\s]+'
-    match = re.search(url_pattern, instructions)
-    return match.group(0) if match else None
+    Walks the tree once, in document order. Content areas (article/main/div
+    with a content-like class) are preferred; nested areas are only read once
+    via their outermost ancestor. Without any content area the whole page is
+    used. Extracted blocks are not descended into, so a <code> inside <pre>
+    or a <p> inside a list item isn't repeated.
+    
+    Args:
+        html: Raw page bytes or string
+        parser: BeautifulSoup parser name (defaults to DEFAULT_HTML_PARSER)
+        
+    Returns:
+        Cleaned text content
+    """
+    soup = BeautifulSoup(html, parser or DEFAULT_HTML_PARSER)
+    
+    area_content = []  # blocks inside content areas
+    page_content = []  # every block, used when the page has no content area
+    
+    # Explicit stack of (children iterator, inside_area) to avoid recursion
+    # limits on deep pages while still visiting nodes in document order
+    stack = [(iter(soup.children), False)]
+    while stack:
+        children, inside_area = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            continue
+        if not isinstance(child, Tag) or child.name in SKIPPED_TAGS:
+            continue
+        
+        blocks = _block_text(child)
+        if blocks is not None:
+            page_content.extend(blocks)
+            if inside_area:
+                area_content.extend(blocks)
+            continue
+        
+        stack.append((iter(child.children), inside_area or _is_content_area(child)))
+    
+    text_content = area_content or page_content
+    
+    # Join and clean content
+    full_content = "\n".join(text_content)
+    
+    # Remove excessive whitespace
+    full_content = re.sub(r'\n{3,}', '\n\n', full_content)
+    full_content = full_content.strip()
+    
+    return full_content
+
+
+def _read_streaming(response, max_bytes, max_chars):
+    """
+    Feed a streamed response into StreamingTextExtractor.
+    
+    Stops after max_bytes, or as soon as max_chars of text are collected
+    inside content areas. Page-level text doesn't count toward the early stop,
+    since it's dropped once a content area turns up later in the page.
+    Returns (text, raw body, partial cap): the cap is None when the whole body
+    was read, else the largest max_chars the partial text satisfies.
+    """
+    charset = requests.utils.get_encoding_from_headers(response.headers)
+    if not charset or charset.lower() == "iso-8859-1":
+        charset = "utf-8"  # requests' text/* default is wrong for most HTML
+    decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+    
+    extractor = StreamingTextExtractor()
+    body = bytearray()
+    complete, cap = True, None
+    for chunk in response.iter_content(chunk_size=16 * 1024):
+        if len(body) + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - len(body)]
+            complete = False
+        body.extend(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if not complete:
+            print(f"✂️ Stopped at the {max_bytes} byte limit")
+            break
+        if max_chars and extractor.area_chars >= max_chars:
+            complete, cap = False, max_chars
+            print(f"✂️ Collected {max_chars} characters after {len(body)} bytes, stopping download")
+            break
+    if complete:
+        extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    
+    full_content = "\n".join(extractor.blocks())
+    full_content = re.sub(r'\n{3,}', '\n\n', full_content).strip()
+    if not complete and cap is None:
+        cap = len(full_content)  # stopped at max_bytes: only covers the text read so far
+    return full_content, bytes(body), cap
 
 
-def fetch_content_from_url(url: str) -> dict:
+def fetch_content_from_url(url: str, stream: bool = False, max_bytes: int = None, max_chars: int = None,
+                           timeout: float = 15) -> dict:
     """
     Fetch and parse content from URL using BeautifulSoup
     
+    With stream=True the Content-Type is checked before the body is read,
+    the body is parsed incrementally while downloading, at most max_bytes are
+    read, and the download stops once max_chars of text are collected.
+    
     Args:
         url: URL to fetch content from
+        stream: Use the streaming, size-capped fetch
+        max_bytes: Byte limit for stream mode (default FETCH_MAX_BYTES, 2 MB)
+        max_chars: Stop stream mode once this much text is extracted
+        timeout: Connect/read timeout in seconds
         
     Returns:
         dict with 'success', 'content', 'error' keys
     """
     try:
+        entry = _url_cache.get(url) if _url_cache else None
+        if entry and not _url_cache.covers(entry, max_chars):
+            entry = None  # a partial read too short for this request; fetch it again in full
+        if entry and _url_cache.is_fresh(entry):
+            print(f"💾 Using cached content for: {url}")
+            return {'success': True, 'content': entry['content'], 'error': None}
+        
         print(f"📡 Fetching content from: {url}")
         
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        response = requests.get(url, timeout=15, headers=headers)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove unwanted elements
-        for element in soup(["script", "style", "nav", "footer", "header", "aside", "iframe"]):
-            element.decompose()
-        
-        # Try to find main content areas
-        content_areas = soup.find_all(
-            ['article', 'main', 'div'], 
-            class_=lambda x: x and any(keyword in x.lower() for keyword in ['content', 'article', 'post', 'entry', 'body'])
-        )
-        
-        if not content_areas:
-            # Fallback to body or entire document
-            content_areas = [soup.body] if soup.body else [soup]
-        
-        text_content = []
+        if entry:
+            headers.update(_url_cache.conditional_headers(entry))
+        response = _http_session.get(url, timeout=timeout, headers=headers, stream=stream)
         
-        for area in content_areas:
-            # Extract headings
-            for heading in area.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                heading_text = heading.get_text(strip=True)
-                if heading_text:
-                    text_content.append(f"\n## {heading_text}\n")
-            
-            # Extract paragraphs
-            for para in area.find_all('p'):
-                para_text = para.get_text(strip=True)
-                if para_text and len(para_text) > 10:  # Filter out very short paragraphs
-                    text_content.append(para_text)
-            
-            # Extract code blocks
-            for code in area.find_all(['pre', 'code']):
-                code_text = code.get_text(strip=True)
-                if code_text:
-                    text_content.append(f"\n```\n{code_text}\n```\n")
-            
-            # Extract list items
-            for ul in area.find_all(['ul', 'ol']):
-                for li in ul.find_all('li', recursive=False):
-                    li_text = li.get_text(strip=True)
-                    if li_text:
-                        text_content.append(f"• {li_text}")
+        if entry and response.status_code == 304:
+            print(f"♻️ Not modified, reusing extracted content for: {url}")
+            _url_cache.refresh(url, entry, response)
+            response.close()
+            return {'success': True, 'content': entry['content'], 'error': None}
         
-        # Join and clean content
-        full_content = "\n".join(text_content)
+        response.raise_for_status()
         
-        # Remove excessive whitespace
-        full_content = re.sub(r'\n{3,}', '\n\n', full_content)
-        full_content = full_content.strip()
+        body, cap = None, None
+        if stream:
+            with response:
+                content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                if content_type and content_type not in STREAMABLE_CONTENT_TYPES:
+                    return {
+                        'success': False,
+                        'content': None,
+                        'error': f'Unsupported content type: {content_type}'
+                    }
+                max_bytes = max_bytes or int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+                full_content, body, cap = _read_streaming(response, max_bytes, max_chars)
+        else:
+            full_content = extract_text_from_html(response.content)
         
         if not full_content or len(full_content) < 100:
             return {
@@ -248,6 +1164,10 @@ def fetch_content_from_url(url: str) -> dict:
         
         print(f"✅ Successfully fetched {len(full_content)} characters")
         
+        # A partial read is stored with its size and only served to requests it covers
+        if _url_cache:
+            _url_cache.store(url, response, full_content, body=body, max_chars=cap)
+        
         return {
             'success': True,
             'content': full_content,
@@ -270,57 +1190,235 @@ def fetch_content_from_url(url: str) -> dict:
         return {'success': False, 'content': None, 'error': error_msg}
 
 
-def process_instructions_with_url(instructions: str) -> dict:
+def _host_limit(url):
+    """Semaphore capping concurrent requests to one host"""
+    host = urlsplit(url).netloc.lower()
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(FETCH_PER_HOST)
+        return _host_limits[host]
+
+
+def _fetch_with_host_limit(url, max_chars, deadline):
+    with _host_limit(url):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return {'success': False, 'content': None, 'error': f"Timeout while fetching URL: {url}"}
+        return fetch_content_from_url(url, stream=True, max_chars=max_chars, timeout=min(15, remaining))
+
+
+def fetch_contents_from_urls(urls: list, max_chars: int = 3000, total_timeout: float = None) -> dict:
     """
-    Process instructions and fetch content if URL is detected
+    Fetch several URLs concurrently under one total timeout
+    
+    Each page may download up to max_chars of text (any one of them might
+    end up being the only source); pages that aren't done by the deadline
+    are reported as timed out.
     
     Args:
-        instructions: User instructions text
+        urls: URLs to fetch
+        max_chars: Text budget shared by all pages
+        total_timeout: Seconds for the whole batch (default FETCH_TOTAL_TIMEOUT, 15)
         
     Returns:
-        dict with 'has_url', 'url', 'content', 'enhanced_instructions' keys
+        dict of url -> fetch_content_from_url result, in the order of urls
     """
-    url = detect_url_in_instructions(instructions)
+    if total_timeout is None:
+        total_timeout = float(os.getenv("FETCH_TOTAL_TIMEOUT", "15"))
+    deadline = time.monotonic() + total_timeout
     
-    if not url:
-        return {
-            'has_url': False,
-            'url': None,
-            'content': None,
-            'enhanced_instructions': instructions
-        }
+    executor = ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(urls)) or 1)
+    futures = {url: executor.submit(_fetch_with_host_limit, url, max_chars, deadline) for url in urls}
+    wait(futures.values(), timeout=total_timeout)
+    # Don't block on stragglers; their sockets time out on their own
+    executor.shutdown(wait=False, cancel_futures=True)
     
-    print(f"🔍 URL detected in instructions: {url}")
+    results = {}
+    for url, future in futures.items():
+        if future.done() and not future.cancelled():
+            results[url] = future.result()
+        else:
+            print(f"⏱️ Gave up on {url} after the {total_timeout:.0f}s total timeout")
+            results[url] = {'success': False, 'content': None, 'error': f"Timeout while fetching URL: {url}"}
+    return results
+
+
+def split_budget(lengths: list, budget: int) -> list:
+    """
+    Share a budget (characters or tokens) between sources: short sources keep
+    all their text and whatever they leave over is split evenly among the
+    longer ones.
+    """
+    shares = [0] * len(lengths)
+    remaining = budget
+    pending = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    while pending:
+        fair_share = remaining // len(pending)
+        i = pending.pop(0)
+        shares[i] = min(lengths[i], fair_share)
+        remaining -= shares[i]
+    return shares
+
+
+def _fetch_and_pack(urls, budget, max_tokens):
+    """
+    Fetch the pages and pack each one's leading text into its share of max_tokens
     
-    result = fetch_content_from_url(url)
+    Returns (sources, prompt sections, full fetched text), or None if nothing was fetched.
+    """
+    # ~6 characters per token is generous, so every page still has enough text to fill its share
+    results = fetch_contents_from_urls(urls, max_chars=max_tokens * 6)
+    fetched = {url: result['content'] for url, result in results.items() if result['success']}
+    for url, result in results.items():
+        if not result['success']:
+            print(f"⚠️ Failed to fetch {url}: {result['error']}")
+    if not fetched:
+        return None
     
-    if result['success']:
-        # Limit content size for LLM context (keep first 3000 chars)
-        content = result['content']
-        if len(content) > 3000:
-            content = content[:3000] + "\n\n[Content truncated for length...]"
-        
-        enhanced_instructions = f"""Content fetched from: {url}
+    # Share the token budget between sources, cutting each at a sentence boundary
+    headers = [f"### Source: {url}\n" if len(fetched) > 1 else "" for url in fetched]
+    header_tokens = sum(budget.counter.count(header) + 1 for header in headers)  # +1 for the separator
+    shares = split_budget(
+        [budget.counter.count(content) for content in fetched.values()],
+        max(0, max_tokens - header_tokens),
+    )
+    sections, used = [], 0
+    for header, content, share in zip(headers, fetched.values(), shares):
+        packed, tokens = budget.pack(content, share)
+        sections.append(header + packed)
+        used += tokens
+    print(f"🧮 Packed {used} of {max_tokens} content tokens"
+          f" ({budget.counter.source} counts)")
+    
+    return list(fetched), sections, "\n\n".join(fetched.values())
+
+
+def _retrieve_from_index(index, urls, instructions, budget, max_tokens):
+    """
+    Pack the indexed chunks most relevant to the instructions into max_tokens
+    
+    Pages indexed within KB_INDEX_TTL are not fetched again; the others are
+    fetched (up to KB_INDEX_MAX_CHARS of text), chunked and indexed first.
+    Returns (sources, prompt sections, selected chunk text), or None if no page is available.
+    """
+    missing = [url for url in urls if not index.has_fresh(url)]
+    if len(missing) < len(urls):
+        print(f"💾 {len(urls) - len(missing)} URL(s) served from the knowledge index")
+    if missing:
+        results = fetch_contents_from_urls(missing, max_chars=int(os.getenv("KB_INDEX_MAX_CHARS", "100000")))
+        for url, result in results.items():
+            if result['success']:
+                index.add(url, chunk_text(result['content'], budget.counter))
+            else:
+                print(f"⚠️ Failed to fetch {url}: {result['error']}")
+    
+    # A page that failed to refresh is still served from its older copy
+    available = [url for url in urls if index.page_chunks(url, limit=1)]
+    if not available:
+        return None
+    
+    top_k = int(os.getenv("KB_TOP_K", "16"))
+    query = re.sub(r'https?://[^\s]+', ' ', instructions)
+    if re.search(r'\w', query):
+        candidates = index.search(query, urls=available, k=top_k)
+    else:
+        # Nothing to rank by: take the pages from the top, alternating between them
+        candidates = [chunk for url in available for chunk in index.page_chunks(url, limit=top_k)]
+        candidates.sort(key=lambda chunk: chunk["position"])
+    
+    headers = {url: f"### Source: {url}\n" if len(available) > 1 else "" for url in available}
+    limit = max_tokens - sum(budget.counter.count(header) + 1 for header in headers.values())
+    picked, used = [], 0
+    for chunk in candidates:
+        tokens = budget.counter.count(chunk["text"]) + 1
+        if used + tokens <= limit:
+            picked.append(chunk)
+            used += tokens
+    if not picked:
+        return None
+    print(f"🧮 Packed {len(picked)} of {len(candidates)} retrieved chunks, {used} of {max_tokens} content tokens")
+    
+    # Back in document order, grouped by source
+    picked.sort(key=lambda chunk: (available.index(chunk["url"]), chunk["position"]))
+    sources = [url for url in available if any(chunk["url"] == url for chunk in picked)]
+    sections = [
+        headers[url] + "\n\n".join(chunk["text"] for chunk in picked if chunk["url"] == url)
+        for url in sources
+    ]
+    return sources, sections, "\n\n".join(chunk["text"] for chunk in picked)
+
+
+def _knowledge_prompt(sources, knowledge):
+    return f"""Content fetched from: {', '.join(sources)}
 
 KNOWLEDGE BASE CONTENT:
-{content}
+{knowledge}
 
 Generate quiz questions based on the above content."""
+
+
+def process_instructions_with_url(instructions: str) -> dict:
+    """
+    Process instructions and fetch content for every URL they contain
+    
+    All URLs are fetched concurrently (bounded pool, per-host limit, one
+    total timeout) and their text is packed into a shared token budget
+    derived from the provider's model limits (see get_prompt_budget).
+    With the knowledge index (see get_kb_index) pages are chunked and
+    indexed, and the chunks most relevant to the instructions are used
+    instead of each page's leading text.
+    
+    Args:
+        instructions: User instructions text
         
+    Returns:
+        dict with 'has_url', 'url' (first URL), 'urls', 'content', 'enhanced_instructions' keys
+    """
+    urls = detect_urls_in_instructions(instructions)
+    
+    if not urls:
         return {
-            'has_url': True,
-            'url': url,
-            'content': result['content'],
-            'enhanced_instructions': enhanced_instructions
+            'has_url': False,
+            'url': None,
+            'urls': [],
+            'content': None,
+            'enhanced_instructions': instructions
         }
+    
+    print(f"🔍 {len(urls)} URL(s) detected in instructions: {', '.join(urls)}")
+    
+    # Token budget for page text: what the model's context leaves after the
+    # reply and the prompt frame, capped by KB_MAX_TOKENS (long prompts are
+    # what makes llama.cpp prefill slow)
+    budget = get_prompt_budget()
+    max_tokens = min(
+        budget.available_input(_knowledge_prompt(urls, "")),
+        int(os.getenv("KB_MAX_TOKENS", "1000")),
+    )
+    index = get_kb_index()
+    if index is not None:
+        gathered = _retrieve_from_index(index, urls, instructions, budget, max_tokens)
     else:
-        print(f"⚠️ Failed to fetch content: {result['error']}")
+        gathered = _fetch_and_pack(urls, budget, max_tokens)
+    
+    if not gathered:
         print(f"📝 Using original instructions")
         
         return {
             'has_url': True,
-            'url': url,
+            'url': urls[0],
+            'urls': urls,
             'content': None,
             'enhanced_instructions': instructions
         }
-
+    
+    sources, sections, content = gathered
+    enhanced_instructions = _knowledge_prompt(sources, "\n\n".join(sections))
+    
+    return {
+        'has_url': True,
+        'url': urls[0],
+        'urls': urls,
+        'content': content,
+        'enhanced_instructions': enhanced_instructions
+    }
@@ -0,0 +1,123 @@
+# pylint: disable=missing-function-docstring
+
+"""
+Exact-match response cache for the chat clients returned by get_llm().
+
+An in-memory LRU sits in front of a SQLite table. Entries are keyed on the
+client's llm_string (provider type, model, temperature, max_tokens, ...) and
+the whitespace-normalized prompt messages.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+
+class TieredLLMCache(BaseCache):
+    """LangChain cache: LRU in memory, SQLite on disk, TTL and size-based eviction"""
+
+    def __init__(self, path=".llm_cache.db", ttl=86400, max_memory_entries=512, max_disk_bytes=50 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created_at, generations)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._db.commit()
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{llm_string}\0{normalized}".encode()).hexdigest()
+
+    def _remember(self, key, created_at, generations):
+        self._memory[key] = (created_at, generations)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            row = self._db.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or now - row[1] > self.ttl:
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+
+            generations = [loads(value) for value in loads(row[0])]
+            self._remember(key, row[1], generations)
+            self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        value = dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            self._remember(key, now, return_val)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, used_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        """Drop expired rows, then least recently used rows until under max_disk_bytes"""
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        excess = total - self.max_disk_bytes
+        freed, doomed = 0, []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY used_at"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            rows, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": rows,
+                "disk_bytes": size,
+            }
@@ -0,0 +1,201 @@
+# pylint: disable=missing-function-docstring
+
+"""
+Token counting and prompt packing (knowledge-base content, chat memory).
+
+Counts use tiktoken when it's installed (exact for OpenAI models, a rough
+proxy for other models); otherwise ~4 characters per token. With a
+tokenize_url, texts of server_min_chars or more are counted by the llama.cpp
+server's own /tokenize endpoint (exact for the loaded model), and shorter
+pieces such as single sentences are counted locally and scaled by the
+server/local ratio seen so far, so packing a page doesn't cost one request
+per sentence. Counts are memoized per content hash, so the same page or
+sentence is only tokenized once.
+"""
+
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Sentence ends (., ! or ? followed by whitespace) and line breaks
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def split_sentences(text):
+    """Split text into sentences, each keeping its trailing whitespace"""
+    pieces, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        pieces.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+class TokenCounter:
+    """Memoized token counts for one tokenizer (a llama.cpp server's, or tiktoken's)"""
+
+    def __init__(self, model=None, max_entries=4096, tokenize_url=None, server_min_chars=1000, timeout=5):
+        self.max_entries = max_entries
+        self.tokenize_url = tokenize_url
+        self.server_min_chars = server_min_chars
+        self.timeout = timeout
+        self._memo = OrderedDict()  # content hash -> token count
+        self._lock = threading.Lock()
+        self._session = requests.Session() if tokenize_url else None
+        self._server_retry_at = 0.0  # after a failure, count locally until then
+        self._server_tokens = 0  # server and local counts of the same texts, for scaling
+        self._local_tokens = 0
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                try:
+                    self.encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+                except KeyError:
+                    self.encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # The encoding files are downloaded on first use
+                print(f"⚠️ tiktoken encoding unavailable ({e}), estimating token counts")
+
+    @property
+    def exact(self):
+        return self.tokenize_url is not None or self.encoding is not None
+
+    @property
+    def source(self):
+        if self.tokenize_url is not None:
+            return "server tokenizer"
+        return "tiktoken" if self.encoding is not None else "estimated"
+
+    def _server_tokenize(self, text):
+        """Token ids from the llama.cpp server, or None if it can't be reached"""
+        if time.monotonic() < self._server_retry_at:
+            return None
+        try:
+            response = self._session.post(self.tokenize_url, json={"content": text}, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()["tokens"]
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"⚠️ Server tokenizer unavailable ({e}), counting locally for 30s")
+            self._server_retry_at = time.monotonic() + 30
+            return None
+
+    def _local_count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def _tokenize_count(self, text):
+        local = self._local_count(text)
+        if self.tokenize_url is None:
+            return local
+        if len(text) >= self.server_min_chars:
+            tokens = self._server_tokenize(text)
+            if tokens is not None:
+                with self._lock:
+                    self._server_tokens += len(tokens)
+                    self._local_tokens += local
+                return len(tokens)
+        with self._lock:
+            ratio = self._server_tokens / self._local_tokens if self._local_tokens else 1.0
+        return math.ceil(local * ratio)
+
+    def count(self, text):
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        tokens = self._tokenize_count(text)
+        with self._lock:
+            self._memo[key] = tokens
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return tokens
+
+    def truncate(self, text, max_tokens):
+        """Cut text to at most max_tokens, ignoring sentence boundaries"""
+        if self.tokenize_url is not None:
+            tokens = self._server_tokenize(text)
+            if tokens is not None:
+                try:
+                    response = self._session.post(
+                        self.tokenize_url.replace("/tokenize", "/detokenize"),
+                        json={"tokens": tokens[:max_tokens]},
+                        timeout=self.timeout,
+                    )
+                    response.raise_for_status()
+                    return response.json()["content"]
+                except (requests.exceptions.RequestException, ValueError, KeyError):
+                    pass
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+        return text[:max_tokens * 4]
+
+
+class PromptBudget:
+    """Input token budget derived from a model's context window and output limit"""
+
+    def __init__(self, context_window, max_output_tokens, counter=None, safety_margin=32):
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        # Chat formatting adds a few tokens per message; adapters whose counts
+        # are only approximate ask for a wider margin
+        self.safety_margin = safety_margin
+        self.counter = counter or TokenCounter()
+
+    def available_input(self, fixed_text=""):
+        """Tokens left for content once the output, margin and fixed prompt text are reserved"""
+        used = self.max_output_tokens + self.safety_margin + self.counter.count(fixed_text)
+        return max(0, self.context_window - used)
+
+    def pack(self, text, max_tokens, suffix="\n\n[Content truncated for length...]"):
+        return pack_text(self.counter, text, max_tokens, suffix)
+
+
+def pack_text(counter, text, max_tokens, suffix="\n\n[Content truncated for length...]"):
+    """
+    Fit text into max_tokens, cutting at the last sentence boundary that fits.
+
+    The suffix is appended (and counted) only when something was cut.
+    Returns (packed text, token count).
+    """
+    tokens = counter.count(text)
+    if tokens <= max_tokens:
+        return text, tokens
+
+    limit = max_tokens - counter.count(suffix)
+    if limit <= 0:
+        return "", 0
+
+    kept, used = [], 0
+    for sentence in split_sentences(text):
+        sentence_tokens = counter.count(sentence)
+        if used + sentence_tokens > limit:
+            break
+        kept.append(sentence)
+        used += sentence_tokens
+
+    packed = "".join(kept).rstrip()
+    if not packed:
+        # The first sentence alone is too long (e.g. a code block)
+        packed = counter.truncate(text, limit).rstrip()
+    # Sentence counts don't add up exactly once joined; drop from the end until it fits
+    while kept and counter.count(packed) > limit:
+        kept.pop()
+        packed = "".join(kept).rstrip()
+
+    packed += suffix
+    return packed, counter.count(packed)
@@ -0,0 +1,133 @@
+# pylint: disable=missing-function-docstring
+
+"""
+Disk-backed HTTP cache for fetch_content_from_url.
+
+Each URL gets a JSON metadata file (validators, freshness, extracted text)
+and a raw body file in the cache directory. Fresh entries are served without
+a request; stale ones are revalidated with If-None-Match / If-Modified-Since,
+and a 304 reuses the stored extracted text without parsing the page again.
+Partial reads (stream mode stopped at a size cap) are stored with the number
+of characters they hold and only serve requests that need no more than that.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+
+def parse_freshness(headers) -> dict:
+    """Read caching rules from response headers (Cache-Control, Expires)"""
+    cache_control = headers.get("Cache-Control", "").lower()
+    directives = {d.strip() for d in cache_control.split(",")}
+    max_age = 0.0
+
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match:
+        max_age = float(match.group(1))
+    elif headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            max_age = max(0.0, expires - time.time())
+        except (TypeError, ValueError):
+            max_age = 0.0
+
+    return {
+        "no_store": "no-store" in directives,
+        "no_cache": "no-cache" in directives,
+        "max_age": max_age,
+    }
+
+
+class UrlCache:
+    """Per-URL cache entries stored under cache_dir"""
+
+    def __init__(self, cache_dir=".url_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        base = os.path.join(self.cache_dir, digest)
+        return f"{base}.json", f"{base}.body"
+
+    def get(self, url):
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def is_fresh(entry):
+        if entry["no_cache"]:
+            return False
+        return time.time() - entry["fetched_at"] < entry["max_age"]
+
+    @staticmethod
+    def covers(entry, max_chars=None):
+        """Whether the entry has enough text for a request capped at max_chars (None: the whole page)"""
+        if entry.get("max_chars") is None:
+            return True
+        return max_chars is not None and max_chars <= entry["max_chars"]
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _write_meta(self, url, entry):
+        meta_path, _ = self._paths(url)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, meta_path)
+
+    def store(self, url, response, content, body=None, max_chars=None):
+        """Save a 200 response's body, validators and extracted text (max_chars: size of a partial read)"""
+        freshness = parse_freshness(response.headers)
+        if freshness["no_store"]:
+            return
+        _, body_path = self._paths(url)
+        with open(body_path, "wb") as f:
+            f.write(response.content if body is None else body)
+        self._write_meta(url, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "content": content,
+            "max_chars": max_chars,
+            **freshness,
+        })
+
+    def refresh(self, url, entry, response):
+        """
+        Record a 304: the stored body is still valid, update freshness/validators
+
+        Only the fields the 304 actually carries replace the stored ones
+        (RFC 9111 4.3.4); a 304 without Cache-Control or Expires keeps the
+        stored max-age.
+        """
+        freshness = parse_freshness(response.headers)
+        if response.headers.get("Cache-Control"):
+            entry.update(freshness)
+        elif response.headers.get("Expires"):
+            entry["max_age"] = freshness["max_age"]
+        entry["fetched_at"] = time.time()
+        entry["etag"] = response.headers.get("ETag", entry.get("etag"))
+        entry["last_modified"] = response.headers.get("Last-Modified", entry.get("last_modified"))
+        self._write_meta(url, entry)
+
+    def raw_body(self, url):
+        _, body_path = self._paths(url)
+        with open(body_path, "rb") as f:
+            return f.read()
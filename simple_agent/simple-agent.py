@@ -1,18 +1,15 @@
-import requests
+# Run from the repository root with it on PYTHONPATH so weather_tool.py is found:
+#     PYTHONPATH=. python simple_agent/simple-agent.py   (PowerShell: $env:PYTHONPATH=".")
+
 from dotenv import load_dotenv
 
 from langchain.agents import create_agent
-from langchain.tools import tool
 from langchain_ollama import ChatOllama   # NEW import
 
-load_dotenv()
-
+# weather_tool.py lives in the repository root (see the note at the top)
+from weather_tool import get_weather  # cached, pooled, trimmed wttr.in lookup
 
-@tool("get_weather")
-def get_weather(city: str):
-    """Get the current weather for a given location."""
-    response = requests.get(f"https://wttr.in/{city}?format=j1")
-    return response.json()
+load_dotenv()
 
 
 # Create LLM object (NOT string)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+
+
+class ResultCache:
+    """
+    Two-tier cache of voice note results (transcript + extracted data).
+
+    An in-process LRU sits in front of a SQLite table so results survive
+    restarts. Keys are either ``file:<file_unique_id>`` or ``sha256:<digest>``
+    of the audio bytes. Entries expire after ``ttl`` seconds; the SQLite table
+    is trimmed to ``max_rows`` oldest-first.
+
+    Memory hits are answered on the event loop; SQLite reads and writes run
+    on a single dedicated thread so they never block it.
+    """
+
+    def __init__(self, db_path: str, ttl: float, memory_size: int, max_rows: int):
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-cache")
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)"
+        )
+        self._db.commit()
+        self._writes = 0
+
+    def _remember(self, key: str, created_at: float, value: dict) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, key: str) -> dict | None:
+        """Return the cached value for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+        return await self._run(self._load, key, now)
+
+    def _load(self, key: str, now: float) -> dict | None:
+        row = self._db.execute(
+            "SELECT value, created_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or now - row[1] > self.ttl:
+            return None
+        value = json.loads(row[0])
+        with self._lock:
+            self._remember(key, row[1], value)
+        return value
+
+    async def set(self, keys: list[str], value: dict) -> None:
+        """Store value under every key (e.g. file id and content hash)."""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                self._remember(key, now, value)
+        await self._run(self._store, keys, json.dumps(value), now)
+
+    def _store(self, keys: list[str], encoded: str, now: float) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)",
+            [(key, encoded, now) for key in keys],
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict(now)
+        self._db.commit()
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def close(self) -> None:
+        # Let queued writes finish first
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+
+result_cache = (
+    ResultCache(
+        settings.CACHE_DB_PATH,
+        ttl=settings.CACHE_TTL,
+        memory_size=settings.CACHE_MEMORY_SIZE,
+        max_rows=settings.CACHE_MAX_ROWS,
+    )
+    if settings.CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,74 @@
+import httpx
+from openai import AsyncOpenAI
+from app.config import settings
+
+# Long-lived clients, created in the FastAPI lifespan and closed on shutdown.
+_telegram_client: httpx.AsyncClient | None = None
+_openai_client: AsyncOpenAI | None = None
+_local_whisper_client: AsyncOpenAI | None = None
+
+
+def _build_http_client(read_timeout: float) -> httpx.AsyncClient:
+    """Create a keep-alive, connection-limited httpx client."""
+    return httpx.AsyncClient(
+        http2=settings.HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=settings.HTTP_CONNECT_TIMEOUT),
+    )
+
+
+def get_telegram_client() -> httpx.AsyncClient:
+    """Return the shared client for api.telegram.org, creating it on first use."""
+    global _telegram_client
+    if _telegram_client is None:
+        _telegram_client = _build_http_client(settings.TELEGRAM_API_TIMEOUT)
+    return _telegram_client
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the shared OpenAI client used by both the transcriber and the parser."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=_build_http_client(settings.OPENAI_TIMEOUT),
+        )
+    return _openai_client
+
+
+def get_local_whisper_client() -> AsyncOpenAI:
+    """Return the client for the local OpenAI-compatible speech server."""
+    global _local_whisper_client
+    if _local_whisper_client is None:
+        _local_whisper_client = AsyncOpenAI(
+            base_url=settings.LOCAL_WHISPER_BASE_URL,
+            api_key="local-whisper",  # Required by the SDK, ignored by local servers
+            http_client=_build_http_client(settings.LOCAL_WHISPER_TIMEOUT),
+        )
+    return _local_whisper_client
+
+
+async def startup() -> None:
+    """Open the upstream clients so the first request doesn't pay for it."""
+    get_telegram_client()
+    get_openai_client()
+    if settings.TRANSCRIPTION_BACKEND == "local":
+        get_local_whisper_client()
+
+
+async def shutdown() -> None:
+    """Close the upstream clients and their connection pools."""
+    global _telegram_client, _openai_client, _local_whisper_client
+    if _telegram_client is not None:
+        await _telegram_client.aclose()
+        _telegram_client = None
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+    if _local_whisper_client is not None:
+        await _local_whisper_client.close()
+        _local_whisper_client = None
@@ -10,18 +10,74 @@ class Settings:
     TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    # Override to point at a local Bot API server (or the benchmark's fake one)
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+    # Set to DEBUG to log full update payloads
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
 
     # Directory to store downloaded voice files temporarily
     DOWNLOADS_DIR: str = os.path.join(
         os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "downloads"
     )
 
+    # Stream voice notes from Telegram straight into Whisper without touching disk
+    IN_MEMORY_AUDIO: bool = os.getenv("IN_MEMORY_AUDIO", "true").lower() == "true"
+    # Largest voice note accepted (Telegram's Bot API download limit is 20 MB)
+    MAX_VOICE_BYTES: int = int(os.getenv("MAX_VOICE_BYTES", str(20 * 1024 * 1024)))
+
+    # Background worker pool behind /webhook
+    WORKER_COUNT: int = int(os.getenv("WORKER_COUNT", "4"))
+    QUEUE_MAX_SIZE: int = int(os.getenv("QUEUE_MAX_SIZE", "1000"))
+    QUEUE_MAX_PER_CHAT: int = int(os.getenv("QUEUE_MAX_PER_CHAT", "50"))
+    DEDUP_CACHE_SIZE: int = int(os.getenv("DEDUP_CACHE_SIZE", "10000"))
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+
+    # Result cache (transcript + extracted data) keyed by file_unique_id / audio hash
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_DB_PATH: str = os.getenv(
+        "CACHE_DB_PATH",
+        os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache.db"
+        ),
+    )
+    CACHE_TTL: float = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+    CACHE_MEMORY_SIZE: int = int(os.getenv("CACHE_MEMORY_SIZE", "1024"))
+    CACHE_MAX_ROWS: int = int(os.getenv("CACHE_MAX_ROWS", "100000"))
+
     # OpenAI models
     WHISPER_MODEL: str = "whisper-1"
+
+    # Speech-to-text backend: "openai" (hosted Whisper) or "local"
+    TRANSCRIPTION_BACKEND: str = os.getenv("TRANSCRIPTION_BACKEND", "openai")
+    # Local OpenAI-compatible speech server (whisper.cpp, faster-whisper-server, ...)
+    LOCAL_WHISPER_BASE_URL: str = os.getenv("LOCAL_WHISPER_BASE_URL", "http://127.0.0.1:9000/v1")
+    LOCAL_WHISPER_MODEL: str = os.getenv("LOCAL_WHISPER_MODEL", "whisper-1")
+    LOCAL_WHISPER_TIMEOUT: float = float(os.getenv("LOCAL_WHISPER_TIMEOUT", "120"))
     GPT_MODEL: str = "gpt-4o-mini"
 
+    # Micro-batch GPT extraction across concurrent messages
+    EXTRACTION_BATCH_ENABLED: bool = (
+        os.getenv("EXTRACTION_BATCH_ENABLED", "false").lower() == "true"
+    )
+    EXTRACTION_BATCH_SIZE: int = int(os.getenv("EXTRACTION_BATCH_SIZE", "10"))
+    EXTRACTION_BATCH_WINDOW_MS: float = float(os.getenv("EXTRACTION_BATCH_WINDOW_MS", "50"))
+
+    # Shared HTTP client tuning (one pooled client per upstream)
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+    # Per-stage read timeouts in seconds
+    TELEGRAM_API_TIMEOUT: float = float(os.getenv("TELEGRAM_API_TIMEOUT", "10"))
+    TELEGRAM_DOWNLOAD_TIMEOUT: float = float(os.getenv("TELEGRAM_DOWNLOAD_TIMEOUT", "30"))
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
 
 settings = Settings()
 
-# Ensure downloads directory exists
-os.makedirs(settings.DOWNLOADS_DIR, exist_ok=True)
+# Ensure downloads directory exists (only needed when buffering to disk)
+if not settings.IN_MEMORY_AUDIO:
+    os.makedirs(settings.DOWNLOADS_DIR, exist_ok=True)
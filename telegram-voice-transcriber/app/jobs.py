@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SeenUpdates:
+    """Bounded LRU of Telegram update_ids, used to drop redelivered updates."""
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._ids: OrderedDict[int, None] = OrderedDict()
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._ids
+
+    def add(self, update_id: int) -> None:
+        self._ids[update_id] = None
+        self._ids.move_to_end(update_id)
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+
+class JobQueue:
+    """
+    Bounded, per-chat fair job queue drained by a pool of async workers.
+
+    Jobs are grouped by key (the chat id). Workers take keys round-robin and
+    only one job per key runs at a time, so a noisy chat cannot starve the
+    others and each chat's messages are handled in order.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        workers: int = 4,
+        maxsize: int = 1000,
+        per_key_maxsize: int = 50,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.per_key_maxsize = per_key_maxsize
+        self._pending: dict[Hashable, deque] = {}
+        # Keys with pending jobs and nothing in flight, in round-robin order
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._busy: set = set()
+        self._size = 0
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting to be picked up."""
+        return self._size
+
+    @property
+    def in_flight(self) -> int:
+        """Number of jobs currently being processed."""
+        return len(self._busy)
+
+    def put_nowait(self, key: Hashable, job: Any) -> bool:
+        """Enqueue a job. Returns False when the queue (or the key's share) is full."""
+        jobs = self._pending.setdefault(key, deque())
+        if self._size >= self.maxsize or len(jobs) >= self.per_key_maxsize:
+            if not jobs:
+                del self._pending[key]
+            return False
+        jobs.append(job)
+        self._size += 1
+        if len(jobs) == 1 and key not in self._busy:
+            self._ready.put_nowait(key)
+        return True
+
+    async def _next_job(self) -> tuple[Hashable, Any]:
+        key = await self._ready.get()
+        job = self._pending[key].popleft()
+        self._size -= 1
+        self._busy.add(key)
+        return key, job
+
+    def _release(self, key: Hashable) -> None:
+        self._busy.discard(key)
+        if self._pending.get(key):
+            self._ready.put_nowait(key)
+        else:
+            self._pending.pop(key, None)
+
+    async def _worker(self) -> None:
+        while True:
+            key, job = await self._next_job()
+            try:
+                await self.handler(job)
+            except Exception:
+                logger.exception("Job for %s failed", key)
+            finally:
+                self._release(key)
+
+    def start(self) -> None:
+        """Start the worker tasks."""
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Wait up to drain_timeout seconds for queued jobs, then stop the workers."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + drain_timeout
+        while (self._size or self._busy) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
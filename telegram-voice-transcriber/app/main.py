@@ -1,19 +1,28 @@
+import hashlib
 import json
 import os
 import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
+from app import clients, metrics
+from app.cache import result_cache
 from app.config import settings
-from app.telegram_bot import download_voice_file, send_message, set_webhook
-from app.transcriber import transcribe_audio
+from app.jobs import JobQueue, SeenUpdates
+from app.telegram_bot import (
+    download_voice_bytes,
+    download_voice_file,
+    send_message,
+    set_webhook,
+)
+from app.transcriber import transcribe_audio, transcribe_bytes
 from app.parser import extract_student_data
 
 # ─── Logging ───────────────────────────────────────────────────────────────────
 logging.basicConfig(
-    level=logging.INFO,
+    level=settings.LOG_LEVEL,
     format="%(asctime)s │ %(levelname)-8s │ %(message)s",
 )
 logger = logging.getLogger(__name__)
@@ -22,10 +31,12 @@ logger = logging.getLogger(__name__)
 # ─── Lifespan (startup / shutdown) ────────────────────────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Register the Telegram webhook on startup if WEBHOOK_URL is set."""
+    """Open the shared upstream clients, start the workers and register the webhook."""
+    await clients.startup()
+    job_queue.start()
     if settings.WEBHOOK_URL:
         result = await set_webhook(settings.WEBHOOK_URL)
-        logger.info(f"✅ Webhook registered: {result}")
+        logger.info("✅ Webhook registered: %s", result)
     else:
         logger.warning(
             "⚠️  WEBHOOK_URL not set. Set it in .env and restart, "
@@ -33,6 +44,10 @@ async def lifespan(app: FastAPI):
         )
     yield
     logger.info("🛑 Shutting down...")
+    await job_queue.stop(settings.SHUTDOWN_DRAIN_TIMEOUT)
+    await clients.shutdown()
+    if result_cache:
+        result_cache.close()
 
 
 # ─── FastAPI App ──────────────────────────────────────────────────────────────
@@ -63,11 +78,10 @@ async def register_webhook(url: str):
     return {"result": result}
 
 
-# ─── Telegram Webhook Endpoint ───────────────────────────────────────────────
-@app.post("/webhook")
-async def telegram_webhook(request: Request):
+# ─── Update Processing (runs on the worker pool) ────────────────────────────
+async def process_update(update: dict):
     """
-    Receives incoming updates from Telegram.
+    Handle one Telegram update.
 
     Flow:
     1. Check if the message contains a voice note
@@ -76,14 +90,11 @@ async def telegram_webhook(request: Request):
     4. Extract structured data with GPT
     5. Send the result back to the user
     """
-    update = await request.json()
-    logger.info(f"📩 Incoming update: {json.dumps(update, indent=2)}")
-
     message = update.get("message", {})
     chat_id = message.get("chat", {}).get("id")
 
     if not chat_id:
-        return JSONResponse({"ok": True})
+        return
 
     # ── Handle /start command ──────────────────────────────────────────────
     text = message.get("text", "")
@@ -95,7 +106,7 @@ async def telegram_webhook(request: Request):
             '🎙️ _"Rahul studied 5 hours a day"_\n\n'
             "I'll transcribe it and extract the student's name and study hours.",
         )
-        return JSONResponse({"ok": True})
+        return
 
     # ── Handle voice message ──────────────────────────────────────────────
     voice = message.get("voice")
@@ -104,29 +115,68 @@ async def telegram_webhook(request: Request):
             chat_id,
             "🎤 Please send a *voice message* so I can transcribe it.",
         )
-        return JSONResponse({"ok": True})
+        return
 
     file_id = voice["file_id"]
+    cache_keys = []
+    if result_cache and voice.get("file_unique_id"):
+        cache_keys.append(f"file:{voice['file_unique_id']}")
     local_path = None
 
     try:
-        # Step 1: Acknowledge
-        await send_message(chat_id, "⏳ Processing your voice message...")
+        cached = await result_cache.get(cache_keys[0]) if cache_keys else None
+
+        if cached:
+            metrics.cache_lookups.labels("hit").inc()
+            logger.info("⚡ Cache hit key=%s", cache_keys[0])
+        else:
+            if cache_keys:
+                metrics.cache_lookups.labels("miss").inc()
+
+            # Step 1: Acknowledge
+            await send_message(chat_id, "⏳ Processing your voice message...")
 
-        # Step 2: Download voice file
-        logger.info(f"⬇️  Downloading voice: {file_id}")
-        local_path = await download_voice_file(file_id)
-        logger.info(f"📁 Saved to: {local_path}")
+            # Step 2: Download voice file
+            logger.info("⬇️  Downloading voice file_id=%s", file_id)
+            with metrics.observe_stage("download"):
+                if settings.IN_MEMORY_AUDIO:
+                    audio = await download_voice_bytes(file_id)
+                else:
+                    local_path = await download_voice_file(file_id)
+            if settings.IN_MEMORY_AUDIO:
+                logger.info("📦 Buffered bytes=%d in memory", len(audio))
+                if result_cache:
+                    # Same audio re-uploaded under a new file id
+                    cache_keys.append(f"sha256:{hashlib.sha256(audio).hexdigest()}")
+                    cached = await result_cache.get(cache_keys[-1])
+            else:
+                logger.info("📁 Saved to path=%s", local_path)
 
-        # Step 3: Transcribe with Whisper
-        logger.info("🎙️ Transcribing audio...")
-        transcribed_text = await transcribe_audio(local_path)
-        logger.info(f"📝 Transcription: {transcribed_text}")
+        if cached:
+            transcribed_text = cached["transcript"]
+            extracted_data = cached["extracted"]
+        else:
+            # Step 3: Transcribe with Whisper
+            logger.info("🎙️ Transcribing audio...")
+            with metrics.observe_stage("transcribe"):
+                if settings.IN_MEMORY_AUDIO:
+                    transcribed_text = await transcribe_bytes(audio, f"{file_id}.ogg")
+                else:
+                    transcribed_text = await transcribe_audio(local_path)
+            logger.info("📝 Transcription: %s", transcribed_text)
 
-        # Step 4: Extract structured data with GPT
-        logger.info("🧠 Extracting student data...")
-        extracted_data = await extract_student_data(transcribed_text)
-        logger.info(f"📊 Extracted: {extracted_data}")
+            # Step 4: Extract structured data with GPT
+            logger.info("🧠 Extracting student data...")
+            with metrics.observe_stage("extract"):
+                extracted_data = await extract_student_data(transcribed_text)
+            logger.info("📊 Extracted: %s", extracted_data)
+
+        # Store on a miss, or to link a new file id to audio we already know
+        if result_cache and cache_keys and (not cached or len(cache_keys) > 1):
+            await result_cache.set(
+                cache_keys,
+                {"transcript": transcribed_text, "extracted": extracted_data},
+            )
 
         # Step 5: Send formatted response
         response_message = (
@@ -137,7 +187,7 @@ async def telegram_webhook(request: Request):
         await send_message(chat_id, response_message)
 
     except Exception as e:
-        logger.error(f"❌ Error processing voice: {e}", exc_info=True)
+        logger.error("❌ Error processing voice: %s", e, exc_info=True)
         await send_message(
             chat_id,
             f"❌ Sorry, something went wrong:\n`{str(e)}`",
@@ -147,6 +197,64 @@ async def telegram_webhook(request: Request):
         # Cleanup: remove the downloaded file
         if local_path and os.path.exists(local_path):
             os.remove(local_path)
-            logger.info(f"🗑️ Cleaned up: {local_path}")
+            logger.info("🗑️ Cleaned up path=%s", local_path)
+
+
+job_queue = JobQueue(
+    process_update,
+    workers=settings.WORKER_COUNT,
+    maxsize=settings.QUEUE_MAX_SIZE,
+    per_key_maxsize=settings.QUEUE_MAX_PER_CHAT,
+)
+seen_updates = SeenUpdates(settings.DEDUP_CACHE_SIZE)
+
+
+# ─── Telegram Webhook Endpoint ───────────────────────────────────────────────
+@app.post("/webhook")
+async def telegram_webhook(request: Request):
+    """
+    Receives incoming updates from Telegram.
+
+    The update is queued for the worker pool and acknowledged immediately, so
+    Telegram never waits on (or retries because of) Whisper and GPT latency.
+    Redelivered update_ids are dropped. When the queue is full a 503 is
+    returned so Telegram retries the update later.
+    """
+    update = await request.json()
+    update_id = update.get("update_id")
+    chat_id = update.get("message", {}).get("chat", {}).get("id")
+    logger.info("📩 Incoming update update_id=%s chat_id=%s", update_id, chat_id)
+    # Full dumps are only worth their serialisation cost when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Update payload: %s", json.dumps(update, indent=2))
+
+    if update_id is not None and update_id in seen_updates:
+        metrics.webhook_updates.labels("duplicate").inc()
+        logger.info("🔁 Duplicate update ignored update_id=%s", update_id)
+        return JSONResponse({"ok": True})
+
+    if not chat_id:
+        metrics.webhook_updates.labels("ignored").inc()
+        return JSONResponse({"ok": True})
+
+    if not job_queue.put_nowait(chat_id, update):
+        metrics.webhook_updates.labels("rejected").inc()
+        logger.warning("🚦 Queue full, asking Telegram to retry update_id=%s", update_id)
+        return JSONResponse({"ok": False, "error": "busy"}, status_code=503)
 
+    metrics.webhook_updates.labels("queued").inc()
+    if update_id is not None:
+        seen_updates.add(update_id)
     return JSONResponse({"ok": True})
+
+
+# ─── Metrics ──────────────────────────────────────────────────────────────────
+metrics.queue_depth.set_function(lambda: job_queue.depth)
+metrics.queue_in_flight.set_function(lambda: job_queue.in_flight)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (stage latencies, queue depth, error counts)."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
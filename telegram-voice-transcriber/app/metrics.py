@@ -0,0 +1,54 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Buckets tuned for the pipeline: Telegram calls are ~100ms, Whisper/GPT are seconds
+STAGE_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+stage_seconds = Histogram(
+    "voice_stage_seconds",
+    "Time spent in each stage of the voice pipeline",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+stage_errors = Counter(
+    "voice_stage_errors_total",
+    "Errors raised by each stage of the voice pipeline",
+    ["stage"],
+)
+webhook_updates = Counter(
+    "webhook_updates_total",
+    "Updates received on /webhook by outcome",
+    ["outcome"],
+)
+cache_lookups = Counter(
+    "voice_cache_lookups_total",
+    "Result cache lookups by outcome",
+    ["outcome"],
+)
+extraction_paths = Counter(
+    "extraction_path_total",
+    "Student-data extractions by path (rules or llm)",
+    ["path"],
+)
+queue_depth = Gauge("job_queue_depth", "Jobs waiting for a worker")
+queue_in_flight = Gauge("job_queue_in_flight", "Jobs currently being processed")
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Time a pipeline stage and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.labels(stage).inc()
+        raise
+    finally:
+        stage_seconds.labels(stage).observe(time.perf_counter() - start)
+
+
+def render() -> tuple[bytes, str]:
+    """Return the Prometheus exposition body and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
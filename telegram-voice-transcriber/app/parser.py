@@ -1,8 +1,10 @@
+import asyncio
 import json
-from openai import AsyncOpenAI
+import logging
+import re
+from app.clients import get_openai_client
 from app.config import settings
-
-client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+from app.metrics import extraction_paths
 
 SYSTEM_PROMPT = """You are an intelligent assistant that extracts structured data from student study voice messages.
 
@@ -25,10 +27,93 @@ Return output strictly in JSON format like this:
 If the format is unclear, still try your best to infer.
 Do not return anything except JSON."""
 
+logger = logging.getLogger(__name__)
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+    "twenty": 20, "twenty-one": 21, "twenty-two": 22, "twenty-three": 23,
+    "twenty-four": 24, "a": 1, "an": 1,
+}
+
+PRONOUNS = {"i", "he", "she", "they", "we", "you"}
+
+# Capitalised words that start a sentence but aren't part of a name:
+# time adverbs, fillers, possessives and titles ("Yesterday Rahul",
+# "My Friend Rahul", "Mr Rahul"). Such sentences go to GPT instead.
+NON_NAME_WORDS = {
+    "today", "yesterday", "tomorrow", "tonight", "now", "lately", "recently",
+    "usually", "always", "often", "sometimes", "also", "then", "so", "well",
+    "ok", "okay", "um", "uh", "hmm", "hey", "hi", "hello", "actually",
+    "basically", "and", "but", "the",
+    "my", "our", "your", "his", "her", "their", "its",
+    "mr", "mrs", "ms", "miss", "dr", "sir", "madam", "teacher", "friend",
+    "student", "brother", "sister", "son", "daughter",
+}
+
+MAX_HOURS_PER_DAY = 24
+
+_NUMBER = r"\d+(?:\.\d+)?|" + "|".join(
+    sorted((re.escape(w) for w in NUMBER_WORDS), key=len, reverse=True)
+)
+
+# "{student name} studied {hours} hours a day" and its common variations
+CANONICAL_PATTERN = re.compile(
+    r"^\s*(?P<name>[A-Z][A-Za-z'\-]*(?:\s+[A-Z][A-Za-z'\-]*){0,2}?)\s+"
+    r"(?:has\s+|had\s+|was\s+|is\s+)?(?:studied|studies|study|studying)\s+(?:for\s+)?"
+    r"(?:(?P<half_only>half\s+an?)|(?P<hours>" + _NUMBER + r")(?P<half>\s+and\s+a\s+half)?)"
+    r"\s+(?:hours?|hrs?)(?P<half_after>\s+and\s+a\s+half)?\s+"
+    r"(?:a|per|each|every)\s+day\s*[.!]?\s*$",
+    re.IGNORECASE,
+)
+
+
+def extract_with_rules(transcribed_text: str) -> dict | None:
+    """
+    Extract student data from the canonical sentence shape without calling GPT.
+
+    Handles digits, spelled-out numbers and "and a half". Returns None when
+    the sentence doesn't match closely enough to be trusted: a name word that
+    is lowercase, a pronoun or a known non-name word, or more than 24 hours.
+    """
+    match = CANONICAL_PATTERN.match(transcribed_text)
+    if not match:
+        return None
+
+    name = match.group("name")
+    words = name.split()
+    # The pattern is case-insensitive, so check capitalisation here to avoid
+    # taking "Ravi has" or "she" for a name
+    if not all(word[0].isupper() for word in words) or words[0].lower() in PRONOUNS:
+        return None
+    if any(word.lower().rstrip(".") in NON_NAME_WORDS for word in words):
+        return None
+
+    if match.group("half_only"):
+        hours = 0.5
+    else:
+        raw = match.group("hours").lower()
+        hours = float(raw) if raw[0].isdigit() else float(NUMBER_WORDS[raw])
+        if match.group("half") or match.group("half_after"):
+            hours += 0.5
+    if hours > MAX_HOURS_PER_DAY:
+        return None
+
+    return {
+        "student_name": name,
+        "hours_per_day": int(hours) if hours.is_integer() else hours,
+    }
+
 
 async def extract_student_data(transcribed_text: str) -> dict:
     """
-    Extract structured student data from transcribed text using GPT.
+    Extract structured student data from transcribed text.
+
+    Canonical sentences are handled locally by extract_with_rules; anything
+    else falls back to GPT. The path taken is logged and counted in the
+    extraction_path_total metric.
 
     Args:
         transcribed_text: The text output from Whisper transcription.
@@ -36,7 +121,22 @@ async def extract_student_data(transcribed_text: str) -> dict:
     Returns:
         Dictionary with 'student_name' and 'hours_per_day' keys.
     """
-    response = await client.chat.completions.create(
+    result = extract_with_rules(transcribed_text)
+    if result is not None:
+        extraction_paths.labels("rules").inc()
+        logger.info("Extraction path: rules")
+        return result
+
+    extraction_paths.labels("llm").inc()
+    logger.info("Extraction path: llm")
+    if settings.EXTRACTION_BATCH_ENABLED:
+        return await _get_batcher().submit(transcribed_text)
+    return await extract_with_llm(transcribed_text)
+
+
+async def extract_with_llm(transcribed_text: str) -> dict:
+    """Extract structured student data from transcribed text using GPT."""
+    response = await get_openai_client().chat.completions.create(
         model=settings.GPT_MODEL,
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -48,3 +148,151 @@ async def extract_student_data(transcribed_text: str) -> dict:
 
     result = json.loads(response.choices[0].message.content)
     return result
+
+
+BATCH_SYSTEM_PROMPT = """You are an intelligent assistant that extracts structured data from student study voice messages.
+
+The input will be a JSON array of objects, each with an "id" and the "text"
+of a transcribed sentence from a voice message.
+
+Each sentence is usually in the format:
+"{student name} studied {hours} hours a day"
+
+For every sentence extract:
+- student_name (string)
+- hours_per_day (number)
+
+Return output strictly in JSON format like this, with exactly one object per
+input sentence, carrying that sentence's id:
+
+{
+  "results": [
+    {"id": 0, "student_name": "Rahul", "hours_per_day": 5},
+    {"id": 1, "student_name": "Priya", "hours_per_day": 3}
+  ]
+}
+
+If a sentence is unclear, still try your best to infer.
+Do not return anything except JSON."""
+
+
+async def extract_batch_with_llm(transcripts: list[str]) -> list[dict | None]:
+    """
+    Extract student data for several transcripts with a single GPT request.
+
+    Each transcript is sent with its index as an id and results are matched
+    back by id, not by position. Returns one entry per transcript; ids the
+    model left out, repeated or got malformed are None so callers can retry
+    them individually.
+    """
+    response = await get_openai_client().chat.completions.create(
+        model=settings.GPT_MODEL,
+        messages=[
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": json.dumps([{"id": i, "text": text} for i, text in enumerate(transcripts)]),
+            },
+        ],
+        response_format={"type": "json_object"},
+        temperature=0,
+    )
+
+    items = json.loads(response.choices[0].message.content).get("results", [])
+    by_id: dict[int, list[dict]] = {}
+    for item in items:
+        if not isinstance(item, dict) or not {"id", "student_name", "hours_per_day"} <= item.keys():
+            continue
+        try:
+            item_id = int(item["id"])
+        except (TypeError, ValueError):
+            continue
+        by_id.setdefault(item_id, []).append(item)
+
+    results: list[dict | None] = []
+    for i in range(len(transcripts)):
+        matches = by_id.get(i, [])
+        if len(matches) == 1:
+            item = dict(matches[0])
+            del item["id"]
+            results.append(item)
+        else:
+            results.append(None)
+    return results
+
+
+class ExtractionBatcher:
+    """
+    Collects concurrent extraction requests into one GPT call.
+
+    A batch is sent when max_size transcripts are waiting or window seconds
+    after the first one arrived, whichever comes first. Each caller gets its
+    own result, matched by id; items the batch call fails on, leaves out or
+    answers twice are retried one by one, so a single bad transcript never
+    fails the rest of the batch.
+    """
+
+    def __init__(self, max_size: int, window: float):
+        self.max_size = max_size
+        self.window = window
+        self._items: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, transcribed_text: str) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append((transcribed_text, future))
+        if len(self._items) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        if items:
+            task = asyncio.get_running_loop().create_task(self._run(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: list[tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in items]
+        results: list[dict | None] = [None] * len(items)
+        if len(items) > 1:
+            try:
+                results = await extract_batch_with_llm(texts)
+                logger.info("Batched extraction of %d transcripts", len(items))
+            except Exception:
+                logger.warning("Batched extraction failed, retrying items individually", exc_info=True)
+
+        retry = [i for i, result in enumerate(results) if result is None]
+        retried = await asyncio.gather(
+            *(extract_with_llm(texts[i]) for i in retry), return_exceptions=True
+        )
+        for i, result in zip(retry, retried):
+            results[i] = result
+
+        for (_, future), result in zip(items, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_batcher: ExtractionBatcher | None = None
+
+
+def _get_batcher() -> ExtractionBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = ExtractionBatcher(
+            max_size=settings.EXTRACTION_BATCH_SIZE,
+            window=settings.EXTRACTION_BATCH_WINDOW_MS / 1000,
+        )
+    return _batcher
@@ -1,13 +1,62 @@
 import os
 import httpx
+from app.clients import get_telegram_client
 from app.config import settings
+from app.metrics import observe_stage
 
-TELEGRAM_API_BASE = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}"
+TELEGRAM_API_BASE = f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}"
 TELEGRAM_FILE_BASE = (
-    f"https://api.telegram.org/file/bot{settings.TELEGRAM_BOT_TOKEN}"
+    f"{settings.TELEGRAM_API_URL}/file/bot{settings.TELEGRAM_BOT_TOKEN}"
 )
 
 
+class VoiceTooLargeError(ValueError):
+    """Raised when a voice note exceeds settings.MAX_VOICE_BYTES."""
+
+
+async def _get_file_info(file_id: str) -> dict:
+    """Call getFile and return the file metadata (file_path, file_size)."""
+    response = await get_telegram_client().get(
+        f"{TELEGRAM_API_BASE}/getFile", params={"file_id": file_id}
+    )
+    response.raise_for_status()
+    return response.json()["result"]
+
+
+async def download_voice_bytes(file_id: str) -> bytes:
+    """
+    Stream a voice message from Telegram into memory.
+
+    The body is read chunk by chunk and aborted as soon as it exceeds
+    settings.MAX_VOICE_BYTES, so nothing is written to disk and oversized
+    files are never fully buffered.
+
+    Returns the raw audio bytes.
+    """
+    file_info = await _get_file_info(file_id)
+    max_bytes = settings.MAX_VOICE_BYTES
+    if file_info.get("file_size", 0) > max_bytes:
+        raise VoiceTooLargeError(
+            f"Voice file is {file_info['file_size']} bytes (limit {max_bytes})"
+        )
+
+    buffer = bytearray()
+    async with get_telegram_client().stream(
+        "GET",
+        f"{TELEGRAM_FILE_BASE}/{file_info['file_path']}",
+        timeout=httpx.Timeout(
+            settings.TELEGRAM_DOWNLOAD_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT
+        ),
+    ) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                raise VoiceTooLargeError(f"Voice file exceeds {max_bytes} bytes")
+
+    return bytes(buffer)
+
+
 async def download_voice_file(file_id: str) -> str:
     """
     Download a voice message from Telegram servers.
@@ -18,31 +67,31 @@ async def download_voice_file(file_id: str) -> str:
 
     Returns the local file path.
     """
-    async with httpx.AsyncClient() as client:
-        # Step 1: Get file metadata from Telegram
-        response = await client.get(
-            f"{TELEGRAM_API_BASE}/getFile", params={"file_id": file_id}
-        )
-        response.raise_for_status()
-        file_path = response.json()["result"]["file_path"]
+    # Step 1: Get file metadata from Telegram
+    file_path = (await _get_file_info(file_id))["file_path"]
 
-        # Step 2: Download the actual file
-        file_url = f"{TELEGRAM_FILE_BASE}/{file_path}"
-        file_response = await client.get(file_url)
-        file_response.raise_for_status()
+    # Step 2: Download the actual file
+    file_url = f"{TELEGRAM_FILE_BASE}/{file_path}"
+    file_response = await get_telegram_client().get(
+        file_url,
+        timeout=httpx.Timeout(
+            settings.TELEGRAM_DOWNLOAD_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT
+        ),
+    )
+    file_response.raise_for_status()
 
-        # Step 3: Save to local downloads directory
-        local_path = os.path.join(settings.DOWNLOADS_DIR, f"{file_id}.ogg")
-        with open(local_path, "wb") as f:
-            f.write(file_response.content)
+    # Step 3: Save to local downloads directory
+    local_path = os.path.join(settings.DOWNLOADS_DIR, f"{file_id}.ogg")
+    with open(local_path, "wb") as f:
+        f.write(file_response.content)
 
     return local_path
 
 
 async def send_message(chat_id: int, text: str, parse_mode: str = "Markdown") -> dict:
     """Send a text message to a Telegram chat."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
+    with observe_stage("send"):
+        response = await get_telegram_client().post(
             f"{TELEGRAM_API_BASE}/sendMessage",
             json={
                 "chat_id": chat_id,
@@ -51,23 +100,21 @@ async def send_message(chat_id: int, text: str, parse_mode: str = "Markdown") ->
             },
         )
         response.raise_for_status()
-        return response.json()
+    return response.json()
 
 
 async def set_webhook(webhook_url: str) -> dict:
     """Register a webhook URL with Telegram."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{TELEGRAM_API_BASE}/setWebhook",
-            json={"url": f"{webhook_url}/webhook"},
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await get_telegram_client().post(
+        f"{TELEGRAM_API_BASE}/setWebhook",
+        json={"url": f"{webhook_url}/webhook"},
+    )
+    response.raise_for_status()
+    return response.json()
 
 
 async def delete_webhook() -> dict:
     """Remove the current webhook from Telegram."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(f"{TELEGRAM_API_BASE}/deleteWebhook")
-        response.raise_for_status()
-        return response.json()
+    response = await get_telegram_client().post(f"{TELEGRAM_API_BASE}/deleteWebhook")
+    response.raise_for_status()
+    return response.json()
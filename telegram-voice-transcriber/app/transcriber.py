@@ -1,12 +1,93 @@
-from openai import AsyncOpenAI
+from abc import ABC, abstractmethod
+from typing import IO
+
+from app.clients import get_local_whisper_client, get_openai_client
 from app.config import settings
 
-client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# Either an open binary file or a (filename, bytes) tuple
+AudioInput = IO[bytes] | tuple[str, bytes]
+
+
+# Adapter Pattern - Abstract base class for transcription backends
+class TranscriptionBackend(ABC):
+    """Abstract backend for different speech-to-text providers"""
+
+    @abstractmethod
+    async def transcribe(self, audio: AudioInput) -> str:
+        """Return the transcribed text for the given audio"""
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Backend for the hosted OpenAI Whisper API"""
+
+    async def transcribe(self, audio: AudioInput) -> str:
+        transcript = await get_openai_client().audio.transcriptions.create(
+            model=settings.WHISPER_MODEL,
+            file=audio,
+            language="en",  # Optimize for English; remove for auto-detect
+        )
+        return transcript.text
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Backend for a local OpenAI-compatible speech server
+    (e.g. whisper.cpp server or faster-whisper-server on the same host).
+    """
+
+    async def transcribe(self, audio: AudioInput) -> str:
+        transcript = await get_local_whisper_client().audio.transcriptions.create(
+            model=settings.LOCAL_WHISPER_MODEL,
+            file=audio,
+            language="en",
+        )
+        return transcript.text
+
+
+# Factory Pattern - Creates the transcription backend selected in Settings
+class TranscriptionBackendFactory:
+    """Factory for creating transcription backends based on provider type"""
+
+    _backends = {
+        "openai": OpenAIWhisperBackend,
+        "local": LocalWhisperBackend,
+    }
+
+    @classmethod
+    def create_backend(cls, provider: str) -> TranscriptionBackend:
+        """Create and return the appropriate transcription backend"""
+        provider = provider.lower().strip()
+
+        if provider not in cls._backends:
+            available = ", ".join(cls._backends.keys())
+            raise ValueError(
+                f"Unsupported transcription backend: {provider}. Available backends: {available}"
+            )
+
+        return cls._backends[provider]()
+
+    @classmethod
+    def register_backend(cls, provider: str, backend_class: type):
+        """Register a new transcription backend (for extensibility)"""
+        cls._backends[provider] = backend_class
+
+
+_backend: TranscriptionBackend | None = None
+
+
+def get_backend() -> TranscriptionBackend:
+    """Return the backend chosen by settings.TRANSCRIPTION_BACKEND."""
+    global _backend
+    if _backend is None:
+        _backend = TranscriptionBackendFactory.create_backend(
+            settings.TRANSCRIPTION_BACKEND
+        )
+    return _backend
 
 
 async def transcribe_audio(file_path: str) -> str:
     """
-    Transcribe an audio file using OpenAI Whisper API.
+    Transcribe an audio file with the configured backend.
 
     Args:
         file_path: Local path to the audio file (.ogg, .mp3, .wav, etc.)
@@ -15,10 +96,18 @@ async def transcribe_audio(file_path: str) -> str:
         Transcribed text string.
     """
     with open(file_path, "rb") as audio_file:
-        transcript = await client.audio.transcriptions.create(
-            model=settings.WHISPER_MODEL,
-            file=audio_file,
-            language="en",  # Optimize for English; remove for auto-detect
-        )
+        return await get_backend().transcribe(audio_file)
+
 
-    return transcript.text
+async def transcribe_bytes(audio: bytes, filename: str = "voice.ogg") -> str:
+    """
+    Transcribe in-memory audio with the configured backend.
+
+    Args:
+        audio: Raw audio bytes.
+        filename: Name sent with the upload; its extension tells Whisper the format.
+
+    Returns:
+        Transcribed text string.
+    """
+    return await get_backend().transcribe((filename, audio))
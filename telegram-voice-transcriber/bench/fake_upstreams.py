@@ -0,0 +1,124 @@
+"""
+Local stand-ins for the Telegram Bot API and the OpenAI API.
+
+Serves just enough of both for the voice pipeline: getFile, file downloads,
+sendMessage/setWebhook, audio transcriptions and chat completions. Every
+route sleeps for a configurable delay plus random jitter so upstream latency
+can be simulated.
+
+Run:
+    uvicorn bench.fake_upstreams:app --port 8100
+
+Configuration (environment variables, delays in milliseconds):
+    FAKE_TELEGRAM_DELAY_MS, FAKE_TELEGRAM_JITTER_MS
+    FAKE_DOWNLOAD_DELAY_MS, FAKE_DOWNLOAD_JITTER_MS, FAKE_VOICE_BYTES
+    FAKE_WHISPER_DELAY_MS, FAKE_WHISPER_JITTER_MS, FAKE_TRANSCRIPT
+    FAKE_GPT_DELAY_MS, FAKE_GPT_JITTER_MS
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+
+def _env_ms(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default))) / 1000
+
+
+TELEGRAM_DELAY = (_env_ms("FAKE_TELEGRAM_DELAY_MS", 50), _env_ms("FAKE_TELEGRAM_JITTER_MS", 20))
+DOWNLOAD_DELAY = (_env_ms("FAKE_DOWNLOAD_DELAY_MS", 80), _env_ms("FAKE_DOWNLOAD_JITTER_MS", 40))
+WHISPER_DELAY = (_env_ms("FAKE_WHISPER_DELAY_MS", 800), _env_ms("FAKE_WHISPER_JITTER_MS", 400))
+GPT_DELAY = (_env_ms("FAKE_GPT_DELAY_MS", 600), _env_ms("FAKE_GPT_JITTER_MS", 300))
+VOICE_BYTES = int(os.getenv("FAKE_VOICE_BYTES", "24000"))
+TRANSCRIPT = os.getenv("FAKE_TRANSCRIPT", "Rahul studied 5 hours a day")
+
+app = FastAPI(title="Fake Telegram + OpenAI upstreams")
+
+# chat_id -> time.time() the final result message arrived
+completions: dict[int, float] = {}
+
+
+async def _delay(delay: tuple[float, float]) -> None:
+    base, jitter = delay
+    await asyncio.sleep(base + random.uniform(0, jitter))
+
+
+# ─── Telegram Bot API ─────────────────────────────────────────────────────────
+@app.api_route("/bot{token}/getFile", methods=["GET", "POST"])
+async def get_file(token: str, file_id: str):
+    await _delay(TELEGRAM_DELAY)
+    return {
+        "ok": True,
+        "result": {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": VOICE_BYTES,
+            "file_path": f"voice/{file_id}.oga",
+        },
+    }
+
+
+@app.get("/file/bot{token}/{file_path:path}")
+async def download_file(token: str, file_path: str):
+    await _delay(DOWNLOAD_DELAY)
+    return Response(content=b"\0" * VOICE_BYTES, media_type="audio/ogg")
+
+
+@app.post("/bot{token}/sendMessage")
+async def send_message(token: str, request: Request):
+    body = await request.json()
+    await _delay(TELEGRAM_DELAY)
+    # Only the final result (or an error) ends a job; the "Processing" ack doesn't
+    if not body["text"].startswith("⏳"):
+        completions[body["chat_id"]] = time.time()
+    return {"ok": True, "result": {"message_id": 1}}
+
+
+@app.post("/bot{token}/setWebhook")
+@app.post("/bot{token}/deleteWebhook")
+async def webhook_admin(token: str):
+    return {"ok": True, "result": True}
+
+
+# ─── OpenAI API ───────────────────────────────────────────────────────────────
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    await request.body()
+    await _delay(WHISPER_DELAY)
+    return {"text": TRANSCRIPT}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await _delay(GPT_DELAY)
+    content = json.dumps({"student_name": "Rahul", "hours_per_day": 5})
+    return JSONResponse({
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    })
+
+
+# ─── Benchmark bookkeeping ────────────────────────────────────────────────────
+@app.get("/_bench/completions")
+async def get_completions():
+    return completions
+
+
+@app.post("/_bench/reset")
+async def reset():
+    completions.clear()
+    return {"ok": True}
@@ -0,0 +1,221 @@
+"""
+Load test for the /webhook endpoint against fake Telegram and OpenAI servers.
+
+Sends synthetic voice-note updates at a fixed concurrency and reports:
+- webhook acknowledgement throughput and latency percentiles
+- end-to-end latency (webhook POST -> result delivered to the fake sendMessage)
+- per-stage p50/p95/p99 estimated from the app's /metrics histograms
+
+Run everything locally (spawns the fake upstreams and the app):
+    python -m bench.loadtest --spawn --requests 500 --concurrency 50
+
+Or point it at servers you started yourself:
+    python -m bench.loadtest --app-url http://127.0.0.1:8000 --fake-url http://127.0.0.1:8100
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+STAGES = ("download", "transcribe", "extract", "send")
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of values (q in 0..100)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def parse_histograms(text: str, name: str) -> dict[str, list[tuple[float, float]]]:
+    """Return {stage: [(upper_bound, cumulative_count), ...]} for a Prometheus histogram."""
+    buckets = defaultdict(list)
+    prefix = f"{name}_bucket{{"
+    for line in text.splitlines():
+        if not line.startswith(prefix):
+            continue
+        labels, value = line[len(prefix):].rsplit("} ", 1)
+        parsed = dict(part.split("=", 1) for part in labels.split(","))
+        stage = parsed["stage"].strip('"')
+        bound = parsed["le"].strip('"')
+        buckets[stage].append((float("inf") if bound == "+Inf" else float(bound), float(value)))
+    return {stage: sorted(points) for stage, points in buckets.items()}
+
+
+def histogram_quantile(q: float, buckets: list[tuple[float, float]]) -> float:
+    """Estimate a quantile from cumulative buckets, like PromQL's histogram_quantile."""
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return float("nan")
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def diff_buckets(after, before):
+    """Subtract a previous scrape so only this run's observations are counted."""
+    result = {}
+    for stage, points in after.items():
+        earlier = dict(before.get(stage, []))
+        result[stage] = [(bound, count - earlier.get(bound, 0.0)) for bound, count in points]
+    return result
+
+
+def make_update(i: int, run_id: int) -> dict:
+    chat_id = run_id * 1_000_000 + i
+    file_id = f"bench-{run_id}-{i}"
+    return {
+        "update_id": chat_id,
+        "message": {
+            "message_id": i,
+            "chat": {"id": chat_id, "type": "private"},
+            "voice": {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "duration": 3,
+                "mime_type": "audio/ogg",
+                "file_size": 24000,
+            },
+        },
+    }
+
+
+async def run(args) -> None:
+    run_id = int(time.time()) % 100_000
+    async with httpx.AsyncClient(timeout=30) as client:
+        await client.post(f"{args.fake_url}/_bench/reset")
+        before = parse_histograms((await client.get(f"{args.app_url}/metrics")).text, "voice_stage_seconds")
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        sent_at: dict[int, float] = {}
+        ack_latencies: list[float] = []
+        failures = 0
+
+        async def post(i: int) -> None:
+            nonlocal failures
+            update = make_update(i, run_id)
+            async with semaphore:
+                start = time.time()
+                sent_at[update["message"]["chat"]["id"]] = start
+                response = await client.post(f"{args.app_url}/webhook", json=update)
+                ack_latencies.append(time.time() - start)
+                if response.status_code != 200:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(args.requests)))
+        ack_elapsed = time.perf_counter() - started
+
+        # Wait for the workers to deliver every result to the fake sendMessage
+        deadline = time.perf_counter() + args.drain_timeout
+        completions: dict = {}
+        while time.perf_counter() < deadline:
+            completions = (await client.get(f"{args.fake_url}/_bench/completions")).json()
+            done = sum(1 for chat_id in sent_at if str(chat_id) in completions)
+            if done >= len(sent_at) - failures:
+                break
+            await asyncio.sleep(0.2)
+        total_elapsed = time.perf_counter() - started
+
+        after = parse_histograms((await client.get(f"{args.app_url}/metrics")).text, "voice_stage_seconds")
+
+    end_to_end = [
+        completions[str(chat_id)] - start
+        for chat_id, start in sent_at.items()
+        if str(chat_id) in completions
+    ]
+    stages = diff_buckets(after, before)
+
+    print(f"\nRequests: {args.requests}   concurrency: {args.concurrency}   rejected: {failures}")
+    print(f"Webhook acks:  {args.requests / ack_elapsed:8.1f} req/s   "
+          f"p50 {percentile(ack_latencies, 50) * 1000:7.1f} ms   "
+          f"p95 {percentile(ack_latencies, 95) * 1000:7.1f} ms   "
+          f"p99 {percentile(ack_latencies, 99) * 1000:7.1f} ms")
+    print(f"End-to-end:    {len(end_to_end) / total_elapsed:8.1f} req/s   "
+          f"p50 {percentile(end_to_end, 50) * 1000:7.1f} ms   "
+          f"p95 {percentile(end_to_end, 95) * 1000:7.1f} ms   "
+          f"p99 {percentile(end_to_end, 99) * 1000:7.1f} ms   "
+          f"({len(end_to_end)}/{len(sent_at)} completed)")
+    print("\nPer stage (estimated from /metrics histograms):")
+    for stage in STAGES:
+        buckets = stages.get(stage, [])
+        count = int(buckets[-1][1]) if buckets else 0
+        print(f"  {stage:<11} n={count:<6} "
+              f"p50 {histogram_quantile(0.50, buckets) * 1000:7.1f} ms   "
+              f"p95 {histogram_quantile(0.95, buckets) * 1000:7.1f} ms   "
+              f"p99 {histogram_quantile(0.99, buckets) * 1000:7.1f} ms")
+
+
+def spawn_servers(args) -> list[subprocess.Popen]:
+    """Start the fake upstreams and the app (pointed at them) as subprocesses."""
+    fake_port = args.fake_url.rsplit(":", 1)[1]
+    app_port = args.app_url.rsplit(":", 1)[1]
+    env = {
+        **os.environ,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_API_URL": args.fake_url,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{args.fake_url}/v1",
+        "WEBHOOK_URL": "",
+        "CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    if args.llm:
+        # A sentence the rule-based extractor won't take, so GPT is exercised
+        env["FAKE_TRANSCRIPT"] = "So um Rahul, he did like five hours every single day"
+    uvicorn = [sys.executable, "-m", "uvicorn", "--log-level", "warning"]
+    procs = [
+        subprocess.Popen([*uvicorn, "bench.fake_upstreams:app", "--port", fake_port], env=env),
+        subprocess.Popen([*uvicorn, "app.main:app", "--port", app_port], env=env),
+    ]
+    for url in (args.fake_url + "/_bench/completions", args.app_url + "/health"):
+        for _ in range(100):
+            try:
+                httpx.get(url, timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+    return procs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the voice transcriber webhook")
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--fake-url", default="http://127.0.0.1:8100")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--drain-timeout", type=float, default=120,
+                        help="seconds to wait for all results after the last webhook ack")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start the fake upstreams and the app as subprocesses")
+    parser.add_argument("--llm", action="store_true",
+                        help="with --spawn, return transcripts that need the GPT extractor")
+    args = parser.parse_args()
+
+    procs = spawn_servers(args) if args.spawn else []
+    try:
+        asyncio.run(run(args))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
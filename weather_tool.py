@@ -0,0 +1,153 @@
+"""
+Shared get_weather tool for the agents (simple_agent, advanced_agent).
+
+- One pooled httpx.AsyncClient with timeouts, living on a background event
+  loop, so sync agent.invoke() and async agent.ainvoke() share connections
+- Per-city TTL cache (WEATHER_CACHE_TTL seconds, default 600), holding at
+  most WEATHER_CACHE_SIZE cities (default 256, least recently used dropped);
+  concurrent lookups of the same city share one request
+- wttr.in's format=j1 payload (hourly forecasts for 3 days, thousands of
+  tokens) is projected down to the few fields the agent needs
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+import httpx
+from langchain_core.tools import StructuredTool
+
+WEATHER_URL = os.getenv("WEATHER_API_URL", "https://wttr.in")
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+WEATHER_TIMEOUT = httpx.Timeout(float(os.getenv("WEATHER_TIMEOUT", "10")), connect=3.0)
+
+# Both only touched on the background loop
+_cache = OrderedDict()  # city -> (expires_at, projected weather), least recently used first
+_in_flight = {}  # city -> asyncio.Future
+_client = None
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    """Background event loop that owns the shared client"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="weather-http", daemon=True).start()
+    return _loop
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=WEATHER_TIMEOUT,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+    return _client
+
+
+def project_weather(payload: dict) -> dict:
+    """Keep current conditions and a short daily forecast from a format=j1 payload"""
+    current = (payload.get("current_condition") or [{}])[0]
+    area = (payload.get("nearest_area") or [{}])[0]
+
+    def first_value(entry, key):
+        return ((entry.get(key) or [{}])[0]).get("value")
+
+    days = []
+    for day in payload.get("weather", [])[:3]:
+        hourly = day.get("hourly", [])
+        midday = hourly[len(hourly) // 2] if hourly else {}
+        days.append({
+            "date": day.get("date"),
+            "min_c": day.get("mintempC"),
+            "max_c": day.get("maxtempC"),
+            "description": first_value(midday, "weatherDesc"),
+            "chance_of_rain": max((int(h.get("chanceofrain", 0)) for h in hourly), default=None),
+        })
+
+    return {
+        "location": ", ".join(filter(None, [first_value(area, "areaName"), first_value(area, "country")])),
+        "current": {
+            "temp_c": current.get("temp_C"),
+            "feels_like_c": current.get("FeelsLikeC"),
+            "description": first_value(current, "weatherDesc"),
+            "humidity": current.get("humidity"),
+            "wind_kmph": current.get("windspeedKmph"),
+            "precip_mm": current.get("precipMM"),
+        },
+        "forecast": days,
+    }
+
+
+async def _fetch(city):
+    response = await _get_client().get(f"{WEATHER_URL}/{quote(city, safe='')}", params={"format": "j1"})
+    response.raise_for_status()
+    return project_weather(response.json())
+
+
+async def _lookup(city):
+    """Cached, de-duplicated fetch; runs on the background loop"""
+    key = city.strip().lower()
+    cached = _cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        _cache.move_to_end(key)
+        return cached[1]
+
+    if key not in _in_flight:
+        _in_flight[key] = asyncio.ensure_future(_fetch(city.strip()))
+    future = _in_flight[key]
+    try:
+        weather = await asyncio.shield(future)
+    finally:
+        if _in_flight.get(key) is future and future.done():
+            del _in_flight[key]
+    _remember(key, weather)
+    return weather
+
+
+def _remember(key, weather):
+    now = time.monotonic()
+    _cache[key] = (now + WEATHER_CACHE_TTL, weather)
+    _cache.move_to_end(key)
+    # Drop expired entries from the old end, then the least recently used over the limit
+    while _cache and (next(iter(_cache.values()))[0] <= now or len(_cache) > WEATHER_CACHE_SIZE):
+        _cache.popitem(last=False)
+
+
+def _error(city, e):
+    return {"error": f"Could not get the weather for {city}: {(str(e) or type(e).__name__).splitlines()[0]}"}
+
+
+def fetch_weather(city: str) -> dict:
+    """Projected weather for a city (blocking)"""
+    try:
+        return asyncio.run_coroutine_threadsafe(_lookup(city), _get_loop()).result()
+    except (httpx.HTTPError, ValueError) as e:
+        return _error(city, e)
+
+
+async def afetch_weather(city: str) -> dict:
+    """Projected weather for a city, awaitable from any event loop"""
+    try:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_lookup(city), _get_loop()))
+    except (httpx.HTTPError, ValueError) as e:
+        return _error(city, e)
+
+
+get_weather = StructuredTool.from_function(
+    func=fetch_weather,
+    coroutine=afetch_weather,
+    name="get_weather",
+    description=(
+        "Get the current weather and a 3-day forecast (temperatures in °C, "
+        "description, chance of rain) for a given city."
+    ),
+)